@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import BadRequest
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class DeliveryTracker:
+    """Per-admin delivery status of recent payment screenshots.
+
+    With ``shared`` the statuses live in the cross-worker store, so an
+    approval handled by any worker can edit every admin's copy.
+    """
+
+    def __init__(self, max_entries=None, shared=None):
+        self.max_entries = max_entries or Config.DELIVERY_HISTORY_SIZE
+        self.shared = shared
+        self._deliveries = OrderedDict()
+
+    def start(self, submission_id, user_id, admin_ids):
+        delivery = {
+            'user_id': user_id,
+            'created': time.time(),
+            'admins': {admin_id: {'status': PENDING, 'message_id': None} for admin_id in admin_ids}
+        }
+        if self.shared is not None:
+            self.shared.set(f"delivery:{submission_id}", delivery, publish=False)
+            self.shared.trim("delivery:", self.max_entries)
+            return
+        self._deliveries[submission_id] = delivery
+        while len(self._deliveries) > self.max_entries:
+            self._deliveries.popitem(last=False)
+
+    def mark(self, submission_id, admin_id, status, message_id=None, error=None):
+        delivery = self.get(submission_id)
+        if delivery:
+            delivery['admins'][admin_id] = {'status': status, 'message_id': message_id, 'error': error}
+            if self.shared is not None:
+                self.shared.set(f"delivery:{submission_id}", delivery, publish=False)
+
+    def get(self, submission_id):
+        if self.shared is not None:
+            return _from_json(self.shared.get(f"delivery:{submission_id}"))
+        return self._deliveries.get(submission_id)
+
+    def recent(self, limit=10):
+        if self.shared is not None:
+            return [
+                (key.split(":", 1)[1], _from_json(delivery))
+                for key, delivery in self.shared.items("delivery:", limit)
+            ]
+        return list(self._deliveries.items())[-limit:]
+
+
+def _from_json(delivery):
+    # JSON object keys are strings; admin IDs are ints everywhere else
+    if delivery:
+        delivery['admins'] = {int(admin_id): state for admin_id, state in delivery['admins'].items()}
+    return delivery
+
+
+async def fan_out_photo(bot, limiter, tracker, submission_id, user_id, photo_id, caption, reply_markup):
+    """Send a payment screenshot to every admin concurrently"""
+    tracker.start(submission_id, user_id, Config.ADMIN_IDS)
+
+    async def deliver(admin_id):
+        try:
+            message = await limiter.send(admin_id, lambda: bot.send_photo(
+                chat_id=admin_id,
+                photo=photo_id,
+                caption=caption,
+                reply_markup=reply_markup
+            ))
+            tracker.mark(submission_id, admin_id, SENT, message_id=message.message_id)
+        except Exception as e:
+            logger.error(f"Error sending to admin {admin_id}: {e}")
+            tracker.mark(submission_id, admin_id, FAILED, error=str(e))
+
+    await asyncio.gather(*(deliver(admin_id) for admin_id in Config.ADMIN_IDS))
+
+
+async def update_admin_captions(bot, limiter, tracker, submission_id, caption, skip_admin=None):
+    """Replace the caption and buttons of every admin's copy of a screenshot"""
+    delivery = tracker.get(submission_id)
+    if not delivery:
+        return
+
+    async def edit(admin_id, message_id):
+        try:
+            await limiter.send(admin_id, lambda: bot.edit_message_caption(
+                chat_id=admin_id,
+                message_id=message_id,
+                caption=caption,
+                reply_markup=None
+            ))
+        except BadRequest as e:
+            # Deleted by the admin, or already showing this caption
+            logger.info(f"Could not update screenshot message for admin {admin_id}: {e}")
+        except Exception as e:
+            logger.error(f"Error updating screenshot message for admin {admin_id}: {e}")
+
+    await asyncio.gather(*(
+        edit(admin_id, state['message_id'])
+        for admin_id, state in delivery['admins'].items()
+        if state.get('message_id') and admin_id != skip_admin
+    ))
+
+
+def format_deliveries(tracker, limit=10):
+    """Text summary of recent deliveries for the /deliveries command"""
+    lines = []
+    for submission_id, delivery in tracker.recent(limit):
+        sent_at = time.strftime("%m-%d %H:%M", time.localtime(delivery['created']))
+        lines.append(f"{submission_id} (user {delivery['user_id']}, {sent_at})")
+        for admin_id, state in delivery['admins'].items():
+            line = f"  {admin_id}: {state['status']}"
+            if state.get('error'):
+                line += f" ({state['error']})"
+            lines.append(line)
+    return "\n".join(lines) or "No deliveries yet."
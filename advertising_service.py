@@ -1,8 +1,6 @@
 import logging
-import json
-import gspread
+import time
 from datetime import datetime
-from oauth2client.service_account import ServiceAccountCredentials
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
@@ -12,9 +10,32 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
-from flask import Flask, request
-import threading
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+import asyncio
+import random
+import secrets
+from functools import partial
+from admin_fanout import DeliveryTracker, fan_out_photo, format_deliveries, update_admin_captions
+from broadcast import BroadcastManager, format_broadcast
+from bulk_review import AS_PLAN, REVIEW, review_page
+from callback_router import CallbackRouter, callback_data, short_key
 from config import Config
+from flow_state import FlowStateStore
+from metrics import DUPLICATE_SCREENSHOTS, InstrumentedRequest, instrument_handler, watch_application
+from payment_stats import PaymentStats, format_stats
+from render_cache import RenderCache, edit_message
+from screenshot_index import EXACT, ScreenshotIndex, format_match
+from send_limiter import SendLimiter
+from sheet_cache import SheetCache, run_cache_refresher
+from sheets_client import USER, SheetsClient
+from sheets_gateway import sheets_gateway
+from shared_state import create_shared_state
+from single_flight import CallbackDebouncer
+from storage import APPROVED, PENDING, REJECTED, create_storage
+from supervisor import run_workers
+from update_processor import PerUserUpdateProcessor
+from webhook_server import UpdateQueue, serve_webhook
 
 # Set up logging
 logging.basicConfig(
@@ -23,98 +44,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app for webhooks
-app = Flask(__name__)
-
 # Initialize Google Sheets
 def init_google_sheets():
     try:
-        # Parse the Google Sheet key JSON
-        sheet_key_json = json.loads(Config.GOOGLE_SHEET_KEY)
-        
-        scope = ["https://spreadsheets.google.com/feeds", 
-                "https://www.googleapis.com/auth/drive"]
-        
-        credentials = ServiceAccountCredentials.from_json_keyfile_dict(
-            sheet_key_json, scope
-        )
-        client = gspread.authorize(credentials)
-        sheet = client.open_by_key(Config.SHEET_ID)
-        return sheet
+        return SheetsClient.connect(Config.GOOGLE_SHEET_KEY, Config.SHEET_ID)
     except Exception as e:
         logger.error(f"Error initializing Google Sheets: {e}")
         return None
 
-# Global sheet variable
-sheet = init_google_sheets()
+# Global Sheets client; connected in the background by connect_sheets(), so
+# importing this module and starting the bot never wait on Google
+sheets = None
 
-# Store user levels in memory (you can also use Google Sheets)
-user_levels = {}
+# With several webhook workers, state is shared between them through
+# SQLite and only the leader worker reads Sheets; None with one process
+shared_state = create_shared_state()
+
+# Users, payments and pending approvals (Sheets-only or SQLite + Sheets mirror)
+storage = create_storage(lambda: sheets, shared_state)
 
 # Google Sheets Helper Functions
-def get_about_info():
-    """Get about information from Google Sheets"""
-    try:
-        if sheet:
-            about_sheet = sheet.worksheet(Config.ABOUT_SHEET_NAME)
-            return about_sheet.get_all_values()
-    except Exception as e:
-        logger.error(f"Error getting about info: {e}")
-    return [["About information not found"]]
+# SheetsClient calls block (HTTP, rate limiting, retries); they only ever run
+# on the sheets_gateway worker pool, never directly on the event loop.
+async def _load_worksheet(name, priority=USER):
+    key = f"sheet:{name}"
+    if shared_state and not shared_state.is_leader:
+        # Followers serve what the leader read, giving a just-started
+        # leader a moment to read it first
+        deadline = time.monotonic() + Config.SHEETS_CALL_TIMEOUT
+        while (rows := shared_state.get(key)) is None and time.monotonic() < deadline:
+            await asyncio.sleep(shared_state.poll_interval)
+        if rows is None:
+            raise RuntimeError(f"{name} has not been read by the leader worker yet")
+        return rows
+    if not sheets:
+        raise RuntimeError("Google Sheets is not connected")
+    rows = await sheets_gateway.run(
+        sheets.get_all_values, name, priority=priority, hedge=True, key=f"values:{name}"
+    )
+    if shared_state and rows != shared_state.get(key):
+        shared_state.set(key, rows)
+    return rows
 
-def get_payment_methods():
-    """Get payment methods and prices from Google Sheets"""
-    try:
-        if sheet:
-            payment_sheet = sheet.worksheet(Config.PAYMENTS_SHEET_NAME)
-            return payment_sheet.get_all_values()
-    except Exception as e:
-        logger.error(f"Error getting payment methods: {e}")
-    return [["Payment methods not found"]]
+# About/Payments content changes rarely, so it is served from memory
+about_cache = SheetCache(Config.ABOUT_SHEET_NAME, partial(_load_worksheet, Config.ABOUT_SHEET_NAME))
+payments_cache = SheetCache(Config.PAYMENTS_SHEET_NAME, partial(_load_worksheet, Config.PAYMENTS_SHEET_NAME))
 
-def update_user_level(user_id, username, name, level):
-    """Update user level in Google Sheets"""
-    try:
-        if sheet:
-            users_sheet = sheet.worksheet(Config.USERS_SHEET_NAME)
-            
-            # Check if user exists
-            try:
-                cell = users_sheet.find(str(user_id))
-                users_sheet.update_cell(cell.row, 5, level)  # Update level
-            except gspread.exceptions.CellNotFound:
-                # Add new user
-                users_sheet.append_row([
-                    str(user_id),
-                    username,
-                    name,
-                    str(int(time.time())),
-                    level
-                ])
-            
-            # Update in-memory cache
-            user_levels[user_id] = level
-            return True
-    except Exception as e:
-        logger.error(f"Error updating user level: {e}")
-    return False
+async def get_about_info():
+    """Get about information from the About sheet cache"""
+    about_data = await about_cache.get()
+    return about_data if about_data is not None else [["About information not found"]]
 
-def get_user_info(user_id):
-    """Get user information from Google Sheets"""
-    try:
-        if sheet:
-            users_sheet = sheet.worksheet(Config.USERS_SHEET_NAME)
-            cell = users_sheet.find(str(user_id))
-            if cell:
-                user_data = users_sheet.row_values(cell.row)
-                return {
-                    'level': user_data[4] if len(user_data) > 4 else 'None',
-                    'user_id': user_data[0],
-                    'name': user_data[2],
-                    'username': user_data[1]
-                }
-    except Exception as e:
-        logger.error(f"Error getting user info: {e}")
+async def get_payment_methods():
+    """Get payment methods and prices from the Payments sheet cache"""
+    payment_data = await payments_cache.get()
+    return payment_data if payment_data is not None else [["Payment methods not found"]]
+
+async def get_user_info(user_id):
+    """Get user information from storage, or None if users could not be loaded"""
+    loaded = await storage.ensure_loaded()
+    
+    record = storage.get_user(user_id)
+    if record:
+        return record.to_dict()
+    if not loaded:
+        # Not knowing the level is not the same as having none; never tell
+        # a paying member they have no access because Sheets is down
+        return None
     
     # Return default if not found
     return {
@@ -124,6 +120,39 @@ def get_user_info(user_id):
         'username': 'Not set'
     }
 
+async def connect_sheets():
+    """Connect to Google Sheets, retrying with backoff, then load the live data"""
+    global sheets
+    attempt = 0
+    while sheets is None:
+        # Not on sheets_gateway: connecting does its own retries and may
+        # take longer than a single call's timeout
+        client = await asyncio.get_running_loop().run_in_executor(None, init_google_sheets)
+        if client is not None:
+            sheets = client
+            logger.info("Connected to Google Sheets")
+            break
+        attempt += 1
+        delay = random.uniform(0, min(Config.SHEETS_CONNECT_MAX_BACKOFF, 2 ** attempt))
+        logger.warning(f"Retrying the Google Sheets connection in {delay:.0f}s")
+        await asyncio.sleep(delay)
+    # Replace whatever was warm-loaded from snapshots with the live data
+    await asyncio.gather(storage.ensure_loaded(live=True), about_cache.refresh(), payments_cache.refresh())
+
+# Payment flow state (selected plan/method, awaiting screenshot) survives
+# restarts and is only kept in memory for recently active users
+flow_states = FlowStateStore(shared=shared_state is not None)
+payment_stats = PaymentStats()
+screenshot_index = ScreenshotIndex()
+
+# Outgoing Telegram sends that can burst (admin fan-out) share one limiter
+send_limiter = SendLimiter()
+admin_deliveries = DeliveryTracker(shared=shared_state)
+
+# Campaign messages to all users of a level, sent with what replies leave
+# of the same rate
+broadcasts = BroadcastManager(storage, send_limiter)
+
 # Telegram Bot Handlers
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -138,80 +167,105 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=ReplyKeyboardRemove()
     )
 
+# Callback data codes, dispatched by callback_router (see build_application)
+ABOUT = "a"
+USER_INFO = "u"
+PAYMENT = "p"
+CLOSE_MENU = "x"
+SERVICE = "s"
+PLAN = "pl"        # pl:PLANKEY
+METHOD = "m"       # m:METHOD:PLANKEY
+ADMIN = "ad"       # ad:approve:PAYMENTID:LEVEL or ad:reject:PAYMENTID
+# Only produced by legacy_callback: admin buttons sent before callback codes,
+# whose reference is a payment ID or, on the oldest ones, the user ID
+LEGACY_ADMIN = "al"
+
+# Static menus are built once at import time
+SERVICE_MENU_TEXT = "Meow Advertising Service Menu:"
+SERVICE_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("1. Advertising About", callback_data=callback_data(ABOUT)),
+        InlineKeyboardButton("2. User Info", callback_data=callback_data(USER_INFO))
+    ],
+    [
+        InlineKeyboardButton("3. Payment Method", callback_data=callback_data(PAYMENT))
+    ],
+    [
+        InlineKeyboardButton("4. Close Menu", callback_data=callback_data(CLOSE_MENU))
+    ]
+])
+BACK_TO_SERVICE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Back", callback_data=callback_data(SERVICE))]
+])
+
+# Menus built from About/Payments data, keyed by the cache content version
+menu_cache = RenderCache()
+
 async def service_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /service command - Show service menu"""
-    keyboard = [
-        [
-            InlineKeyboardButton("1. Advertising About", callback_data="about"),
-            InlineKeyboardButton("2. User Info", callback_data="user_info")
-        ],
-        [
-            InlineKeyboardButton("3. Payment Method", callback_data="payment")
-        ],
-        [
-            InlineKeyboardButton("4. Close Menu", callback_data="close_menu")
-        ]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     if update.message:
         await update.message.reply_text(
-            "Meow Advertising Service Menu:",
-            reply_markup=reply_markup
+            SERVICE_MENU_TEXT,
+            reply_markup=SERVICE_MENU_MARKUP
         )
     else:
-        await update.callback_query.edit_message_text(
-            "Meow Advertising Service Menu:",
-            reply_markup=reply_markup
-        )
+        await edit_message(update.callback_query, SERVICE_MENU_TEXT, SERVICE_MENU_MARKUP)
+
+# Users mashing a button get one answer, not one Sheets lookup per tap
+callback_debouncer = CallbackDebouncer(Config.CALLBACK_DEBOUNCE)
+callback_router = CallbackRouter(callback_debouncer)
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle button callbacks"""
-    query = update.callback_query
-    await query.answer()
-    
-    data = query.data
-    
-    if data == "about":
-        await show_about(update, context)
-    elif data == "user_info":
-        await show_user_info(update, context)
-    elif data == "payment":
-        await show_payment_methods(update, context)
-    elif data == "close_menu":
-        await close_menu(update, context)
-    elif data.startswith("pay_"):
-        await show_payment_options(update, context, data)
-    elif data.startswith("method_"):
-        await request_payment_screenshot(update, context, data)
-    elif data == "back_to_service":
-        await service_menu(update, context)
-    elif data == "back_to_payment":
-        await show_payment_methods(update, context)
+    """Handle every inline button through the callback router"""
+    await callback_router.dispatch(update, context)
+
+LEGACY_MENU_CALLBACKS = {
+    "about": ABOUT,
+    "user_info": USER_INFO,
+    "payment": PAYMENT,
+    "close_menu": CLOSE_MENU,
+    "back_to_service": SERVICE,
+    "back_to_payment": PAYMENT,
+}
+
+def legacy_callback(data):
+    """Translate callback data of buttons sent before codes were introduced"""
+    if data in LEGACY_MENU_CALLBACKS:
+        return LEGACY_MENU_CALLBACKS[data], ()
+    prefix, _, rest = data.partition("_")
+    if prefix == "pay":
+        return PLAN, (short_key(rest),)
+    if prefix == "method":
+        method, _, plan = rest.partition("_")
+        return METHOD, (method, short_key(plan))
+    if prefix == "admin":
+        return LEGACY_ADMIN, tuple(rest.split("_", 2))
+    if prefix == "review":
+        return REVIEW, tuple(rest.split("_", 1))
+    return None
+
+def _render_about(about_data):
+    about_text = "Advertising About:\n\n" + "".join("\n".join(row) + "\n\n" for row in about_data)
+    return about_text, BACK_TO_SERVICE_MARKUP
 
 async def show_about(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show advertising about information"""
-    about_data = get_about_info()
-    about_text = "Advertising About:\n\n"
-    
-    for row in about_data:
-        about_text += "\n".join(row) + "\n\n"
-    
-    keyboard = [
-        [InlineKeyboardButton("Back", callback_data="back_to_service")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.edit_message_text(
-        about_text,
-        reply_markup=reply_markup
+    about_data = await get_about_info()
+    about_text, reply_markup = menu_cache.get(
+        "about", about_cache.version, lambda: _render_about(about_data)
     )
+    
+    await edit_message(update.callback_query, about_text, reply_markup)
+
+USER_INFO_UNAVAILABLE = "⏳ Your account details are temporarily unavailable. Please try again in a few minutes."
 
 async def show_user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user information"""
     user_id = update.callback_query.from_user.id
-    user_info = get_user_info(user_id)
+    user_info = await get_user_info(user_id)
+    if user_info is None:
+        await edit_message(update.callback_query, USER_INFO_UNAVAILABLE, BACK_TO_SERVICE_MARKUP)
+        return
     
     user_text = (
         f"User Level - {user_info['level']}\n"
@@ -221,78 +275,86 @@ async def show_user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Level အကြောင်းရာကို payment method မှာ ရေးပေးမယ်"
     )
     
-    keyboard = [
-        [InlineKeyboardButton("Back", callback_data="back_to_service")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.edit_message_text(
-        user_text,
-        reply_markup=reply_markup
-    )
+    await edit_message(update.callback_query, user_text, BACK_TO_SERVICE_MARKUP)
 
-async def show_payment_methods(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show payment methods"""
-    payment_data = get_payment_methods()
-    
-    # Create buttons for each payment plan
-    keyboard = []
-    
+def _plan_start(payment_data):
     # Skip header row if exists
-    start_index = 1 if len(payment_data) > 1 and "Plan" in payment_data[0][0] else 0
+    return 1 if len(payment_data) > 1 and "Plan" in payment_data[0][0] else 0
+
+def _render_payment_methods(payment_data):
+    start_index = _plan_start(payment_data)
     
-    for i, row in enumerate(payment_data[start_index:], start=1):
-        if row and row[0]:  # Check if row has data
+    # One pass builds both the plan buttons and the text
+    keyboard = []
+    lines = []
+    for i, row in enumerate(payment_data):
+        if not row:
+            continue
+        lines.append(" | ".join(str(item) for item in row if item))
+        if i >= start_index and row[0]:
             plan_name = row[0]
             keyboard.append([
-                InlineKeyboardButton(f"{i}. {plan_name}", callback_data=f"pay_{plan_name}")
+                InlineKeyboardButton(
+                    f"{i - start_index + 1}. {plan_name}", callback_data=callback_data(PLAN, short_key(plan_name))
+                )
             ])
     
-    keyboard.append([InlineKeyboardButton("Back", callback_data="back_to_service")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Format payment methods text
-    payment_text = "Payment Method:\n\n"
-    for row in payment_data:
-        if row:  # Check if row is not empty
-            payment_text += " | ".join([str(item) for item in row if item]) + "\n"
-    
-    await update.callback_query.edit_message_text(
-        payment_text,
-        reply_markup=reply_markup
-    )
+    keyboard.append([InlineKeyboardButton("Back", callback_data=callback_data(SERVICE))])
+    payment_text = "Payment Method:\n\n" + "".join(line + "\n" for line in lines)
+    return payment_text, InlineKeyboardMarkup(keyboard)
 
-async def show_payment_options(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show payment options after selecting a plan"""
-    plan_name = update.callback_query.data.replace("pay_", "")
-    
-    context.user_data['selected_plan'] = plan_name
+async def show_payment_methods(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show payment methods"""
+    payment_data = await get_payment_methods()
+    payment_text, reply_markup = menu_cache.get(
+        "payment", payments_cache.version, lambda: _render_payment_methods(payment_data)
+    )
     
+    await edit_message(update.callback_query, payment_text, reply_markup)
+
+def _render_payment_options(plan_name):
     keyboard = [
         [
-            InlineKeyboardButton("KBZ Payment", callback_data=f"method_KBZ_{plan_name}"),
-            InlineKeyboardButton("Wave Money", callback_data=f"method_Wave_{plan_name}")
+            InlineKeyboardButton("KBZ Payment", callback_data=callback_data(METHOD, "KBZ", short_key(plan_name))),
+            InlineKeyboardButton("Wave Money", callback_data=callback_data(METHOD, "Wave", short_key(plan_name)))
         ],
-        [InlineKeyboardButton("Back", callback_data="back_to_payment")]
+        [InlineKeyboardButton("Back", callback_data=callback_data(PAYMENT))]
     ]
+    text = (
+        f"၀ယ်ယူအူဆိုင်ရာ: {plan_name}\n\n"
+        "ကျေးဇူးပြု၍ ငွေပေးချေမှုနည်းလမ်းရွေးချယ်ပါ:"
+    )
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def find_plan(plan_key):
+    """Name of the plan a button's key refers to, or None if it is gone from the sheet"""
+    payment_data = await get_payment_methods()
+    plans = menu_cache.get("plans", payments_cache.version, lambda: {
+        short_key(row[0]): row[0] for row in payment_data[_plan_start(payment_data):] if row and row[0]
+    })
+    return plans.get(plan_key)
+
+async def show_payment_options(update: Update, context: ContextTypes.DEFAULT_TYPE, plan_key):
+    """Show payment options after selecting a plan"""
+    plan_name = await find_plan(plan_key)
+    if plan_name is None:
+        # Renamed or removed since this menu was sent
+        await show_payment_methods(update, context)
+        return
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    flow_states.update(update.effective_user.id, selected_plan=plan_name)
     
-    await update.callback_query.edit_message_text(
-        f"၀ယ်ယူအူဆိုင်ရာ: {plan_name}\n\n"
-        "ကျေးဇူးပြု၍ ငွေပေးချေမှုနည်းလမ်းရွေးချယ်ပါ:",
-        reply_markup=reply_markup
+    text, reply_markup = menu_cache.get(
+        ("plan", plan_name), payments_cache.version, lambda: _render_payment_options(plan_name)
     )
+    await edit_message(update.callback_query, text, reply_markup)
 
-async def request_payment_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def request_payment_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE, method, plan_key):
     """Request payment screenshot from user"""
-    data_parts = update.callback_query.data.split("_")
-    method = data_parts[1]
-    plan = "_".join(data_parts[2:]) if len(data_parts) > 2 else ""
-    
-    context.user_data['payment_method'] = method
-    context.user_data['selected_plan'] = plan
+    plan = await find_plan(plan_key)
+    if plan is None:
+        await show_payment_methods(update, context)
+        return
     
     await update.callback_query.edit_message_text(
         f"ကျေးဇူးပြု၍ {method} ဖြင့် ငွေပေးချေပြီး screen shot ပေးပို့ရန်။\n\n"
@@ -301,140 +363,459 @@ async def request_payment_screenshot(update: Update, context: ContextTypes.DEFAU
     )
     
     # Store payment request info for photo handling
-    context.user_data['awaiting_screenshot'] = True
+    flow_states.update(
+        update.effective_user.id,
+        payment_method=method,
+        selected_plan=plan,
+        awaiting_screenshot=True
+    )
+    payment_stats.record_request(plan, method)
+
+def new_payment_id():
+    """Short random payment ID that fits in callback data.
+
+    The letter prefix keeps IDs from ever looking like a user ID.
+    """
+    while True:
+        payment_id = f"p{secrets.token_hex(4)}"
+        if storage.get_payment(payment_id) is None:
+            return payment_id
+
+def payment_caption(payment, outcome=None):
+    """Admin caption for a payment screenshot, with the outcome once handled"""
+    caption = (
+        f"Payment Screenshot from:\n"
+        f"User: {payment['name']}\n"
+        f"ID: {payment['user_id']}\n"
+        f"Username: @{payment['username']}\n"
+        f"Plan: {payment['plan']}\n"
+        f"Method: {payment['method']}"
+    )
+    match = screenshot_index.match(payment['payment_id'])
+    if match:
+        caption += "\n\n" + format_match(match, storage.get_payment(match['payment_id']))
+    if outcome:
+        caption += f"\n\n{outcome}"
+    return caption
+
+def payment_outcome(payment, admin_name):
+    if payment['status'] == APPROVED:
+        return f"✅ Approved as {payment['level']} by {admin_name}"
+    return f"❌ Rejected by {admin_name}"
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle payment screenshot from user"""
-    if context.user_data.get('awaiting_screenshot'):
+    flow = flow_states.get(update.effective_user.id)
+    if flow.get('awaiting_screenshot'):
         user = update.effective_user
         photo = update.message.photo[-1]  # Get highest resolution photo
         
-        # Forward to all admins
-        for admin_id in Config.ADMIN_IDS:
-            try:
-                # Send photo with admin buttons
-                keyboard = [
-                    [
-                        InlineKeyboardButton("Gold", callback_data=f"admin_approve_{user.id}_Gold"),
-                        InlineKeyboardButton("Platinum", callback_data=f"admin_approve_{user.id}_Platinum"),
-                        InlineKeyboardButton("Ruby", callback_data=f"admin_approve_{user.id}_Ruby")
-                    ],
-                    [InlineKeyboardButton("Failed", callback_data=f"admin_reject_{user.id}")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                caption = (
-                    f"Payment Screenshot from:\n"
-                    f"User: {user.first_name}\n"
-                    f"ID: {user.id}\n"
-                    f"Username: @{user.username}\n"
-                    f"Plan: {context.user_data.get('selected_plan', 'N/A')}\n"
-                    f"Method: {context.user_data.get('payment_method', 'N/A')}"
+        match = screenshot_index.find_exact(photo.file_unique_id)
+        if match and match['user_id'] == user.id:
+            original = storage.get_payment(match['payment_id'])
+            if original and original['status'] == PENDING:
+                # The same screenshot is already waiting for admins
+                DUPLICATE_SCREENSHOTS.inc(EXACT, "suppressed")
+                await update.message.reply_text(
+                    "ဤ screen shot ကို လက်ခံရရှိပြီးဖြစ်ပါသည်။ Admin အတည်ပြုချက်ကို စောင့်ဆိုင်းပေးပါ။"
                 )
-                
-                await context.bot.send_photo(
-                    chat_id=admin_id,
-                    photo=photo.file_id,
-                    caption=caption,
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"Error sending to admin {admin_id}: {e}")
+                flow_states.update(user.id, awaiting_screenshot=False)
+                return
         
+        # Acknowledge the user right away; admins are reached in the background
         await update.message.reply_text(
             "ကျေးဇူးတင်ပါသည်။ သင်၏ screen shot ကို admin ထံပေးပို့ပြီးပါပြီ။ "
             "အတည်ပြုပြီးနောက် သင့်အဆင့်ကို အပ်ဒိတ်လုပ်ပေးပါမည်။"
         )
         
+        # Everything approval needs is recorded now, so admins never have
+        # to look the user up again
+        payment = storage.add_payment({
+            'payment_id': new_payment_id(),
+            'user_id': user.id,
+            'username': user.username or "N/A",
+            'name': user.first_name or "User",
+            'plan': flow.get('selected_plan', 'N/A'),
+            'method': flow.get('payment_method', 'N/A'),
+            'status': PENDING,
+            'created': time.time(),
+            'file_unique_id': photo.file_unique_id
+        })
+        payment_id = payment['payment_id']
+        payment_stats.record_submission(payment)
+        # Indexed right away, so a resend right after this one is caught
+        screenshot_index.add(payment, match)
+        if match:
+            DUPLICATE_SCREENSHOTS.inc(EXACT, "flagged")
+        
+        # Admin buttons and caption are the same for every admin
+        keyboard = [
+            [
+                InlineKeyboardButton(level, callback_data=callback_data(ADMIN, "approve", payment_id, level))
+                for level in ("Gold", "Platinum", "Ruby")
+            ],
+            [InlineKeyboardButton("Failed", callback_data=callback_data(ADMIN, "reject", payment_id))]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        context.application.create_task(check_and_fan_out(
+            context.bot, payment, update.message.photo, match is not None, reply_markup
+        ))
+        
         # Reset the flag
-        context.user_data['awaiting_screenshot'] = False
+        flow_states.update(user.id, awaiting_screenshot=False)
+
+async def check_and_fan_out(bot, payment, photos, known_duplicate, reply_markup):
+    """Look for a near-duplicate of the screenshot, then send it to every admin"""
+    # The smallest size is plenty for a perceptual hash and cheap to fetch
+    phash = await screenshot_index.perceptual_hash(bot, photos[0])
+    if phash is not None:
+        match = None if known_duplicate else screenshot_index.find_similar(payment['payment_id'], phash)
+        screenshot_index.set_hash(payment['payment_id'], phash, match)
+        if match:
+            DUPLICATE_SCREENSHOTS.inc(match['kind'], "flagged")
+    await fan_out_photo(
+        bot, send_limiter, admin_deliveries, payment['payment_id'],
+        payment['user_id'], photos[-1].file_id, payment_caption(payment), reply_markup
+    )
 
-async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def notify_payment_user(bot, payment):
+    """Tell the user their payment was approved or rejected; returns success"""
+    user_id = payment['user_id']
+    if payment['status'] == APPROVED:
+        level = payment['level']
+        text = (
+            f"🎉 ကျေးဇူးတင်ပါသည်။\n\n"
+            f"သင်၏ Level ကို {level} အဖြစ် အတည်ပြုပြီးပါပြီ။\n"
+            f"ယခု {level} ၀န်ဆောင်မှုများကို အသုံးပြုနိုင်ပါပြီ။"
+        )
+        reply_markup = get_level_keyboard(level)
+    else:
+        text = "❌ သင်၏ payment အား အတည်မပြုနိုင်ပါ။ ကျေးဇူးပြု၍ ထပ်မံကြိုးစားပါ။"
+        reply_markup = None
+    try:
+        await send_limiter.send(user_id, lambda: bot.send_message(
+            chat_id=user_id, text=text, reply_markup=reply_markup
+        ))
+        return True
+    except Exception as e:
+        logger.error(f"Error notifying user {user_id} about payment {payment['payment_id']}: {e}")
+        return False
+
+async def edit_screenshot_caption(query, caption):
+    try:
+        await query.edit_message_caption(caption=caption, reply_markup=None)
+    except BadRequest as e:
+        logger.info(f"Could not update screenshot message: {e}")
+
+async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, action, payment_id, level=None):
     """Handle admin callbacks for approving/rejecting payments"""
+    await handle_admin_action(update, context, action, level, lambda: storage.get_payment(payment_id))
+
+async def legacy_admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, action, reference, level=None):
+    """Approve/reject buttons sent before callback codes were introduced"""
+    def find_payment():
+        payment = storage.get_payment(reference)
+        if payment is None and reference.isdigit():
+            # The oldest buttons carry the user ID instead of a payment ID
+            payment = storage.latest_pending_payment(int(reference))
+        return payment
+    await handle_admin_action(update, context, action, level, find_payment)
+
+async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE, action, level, find_payment):
     query = update.callback_query
+    admin = query.from_user
+    
+    # Check if user is admin
+    if admin.id not in Config.ADMIN_IDS:
+        await query.answer("Unauthorized action.", show_alert=True)
+        return
+    
+    if action not in ("approve", "reject") or (action == "approve" and not level):
+        await query.answer()
+        return
+    if action == "reject":
+        level = None
+    
+    payment = find_payment()
+    if payment is None:
+        await query.answer("Payment not found.", show_alert=True)
+        return
+    
+    # Only the first admin to tap moves the payment out of pending
+    status = APPROVED if action == "approve" else REJECTED
+    try:
+        if status == APPROVED:
+            # Sets the user's level too; the spreadsheet is written in the background
+            resolved = storage.approve_payments([(payment['payment_id'], level)], admin.id)
+        else:
+            resolved = storage.resolve_payments([payment['payment_id']], status, admin.id)
+    except Exception as e:
+        logger.error(f"Error resolving payment {payment['payment_id']}: {e}")
+        await query.answer("❌ Error updating user level. The payment is still pending, please try again.",
+                           show_alert=True)
+        return
+    resolved = resolved[0] if resolved else None
+    if resolved is None:
+        payment = storage.get_payment(payment['payment_id'])
+        await query.answer(f"Already {payment['status']} by another admin.", show_alert=True)
+        await edit_screenshot_caption(query, payment_caption(
+            payment, payment_outcome(payment, f"admin {payment['handled_by']}")
+        ))
+        return
     await query.answer()
+    payment_stats.record_resolution(resolved)
     
-    data = query.data
-    admin_id = query.from_user.id
+    await notify_payment_user(context.bot, resolved)
     
-    # Check if user is admin
-    if admin_id not in Config.ADMIN_IDS:
-        await query.edit_message_text("Unauthorized action.")
+    # Show the outcome on this admin's message, then on everyone else's
+    caption = payment_caption(resolved, payment_outcome(resolved, admin.first_name))
+    await edit_screenshot_caption(query, caption)
+    context.application.create_task(update_admin_captions(
+        context.bot, send_limiter, admin_deliveries, resolved['payment_id'], caption, skip_admin=admin.id
+    ))
+
+def plan_level(plan):
+    """The level a plan name refers to (e.g. "Ruby 1 month" -> Ruby), or None"""
+    return next((level for level in LEVEL_KEYBOARDS if level.lower() in (plan or "").lower()), None)
+
+def render_review(admin_id, page=None):
+    """Current review page for an admin, dropping selections handled meanwhile"""
+    flow = flow_states.get(admin_id)
+    pending = storage.pending_payments()
+    pending_ids = {payment['payment_id'] for payment in pending}
+    selected = [payment_id for payment_id in flow.get('review_selected', []) if payment_id in pending_ids]
+    text, reply_markup, page = review_page(
+        pending, set(selected), flow.get('review_page', 0) if page is None else page,
+        Config.REVIEW_PAGE_SIZE, list(LEVEL_KEYBOARDS)
+    )
+    flow_states.update(admin_id, review_selected=selected, review_page=page)
+    return text, reply_markup
+
+def resolve_selected(admin, payment_ids, status, level=None):
+    """Approve (at ``level``, or each at its plan's level) or reject many payments at once.
+
+    All payments are resolved in one storage transaction and all levels
+    set in another, so the Users sheet gets them in a single batched
+    write. Returns the payments that were still pending.
+    """
+    changes = []
+    for payment_id in payment_ids:
+        payment = storage.get_payment(payment_id)
+        if payment is None:
+            continue
+        target = None
+        if status == APPROVED:
+            target = plan_level(payment['plan']) if level == AS_PLAN else level
+            if target is None:
+                # No level to approve at; stays selected for the admin to decide
+                continue
+        changes.append((payment_id, target))
+    if status == APPROVED:
+        resolved = storage.approve_payments(changes, admin.id)
+    else:
+        resolved = storage.resolve_payments([payment_id for payment_id, _ in changes], status, admin.id)
+    payment_stats.record_resolutions(resolved)
+    return resolved
+
+async def finish_bulk_review(bot, admin, resolved):
+    """Notify users and update every admin's screenshot caption concurrently, then report"""
+    notified = await asyncio.gather(*(notify_payment_user(bot, payment) for payment in resolved))
+    await asyncio.gather(*(
+        update_admin_captions(
+            bot, send_limiter, admin_deliveries, payment['payment_id'],
+            payment_caption(payment, payment_outcome(payment, admin.first_name))
+        )
+        for payment in resolved
+    ))
+    summary = f"Bulk review done: {len(resolved)} payments, {sum(notified)} users notified."
+    if not all(notified):
+        summary += f"\n❌ {len(notified) - sum(notified)} users could not be notified."
+    try:
+        await send_limiter.send(admin.id, lambda: bot.send_message(chat_id=admin.id, text=summary))
+    except Exception as e:
+        logger.error(f"Error reporting bulk review to admin {admin.id}: {e}")
+
+async def review_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /review command - Page through pending payments and handle many at once"""
+    if update.effective_user.id not in Config.ADMIN_IDS:
+        await update.message.reply_text("Unauthorized action.")
         return
     
-    if data.startswith("admin_approve_"):
-        # Format: admin_approve_USERID_LEVEL
-        parts = data.split("_")
-        if len(parts) >= 4:
-            user_id = int(parts[2])
-            level = parts[3]
-            
-            # Update user level
-            user = await context.bot.get_chat(user_id)
-            success = update_user_level(
-                user_id=user_id,
-                username=user.username or "N/A",
-                name=user.first_name or "User",
-                level=level
-            )
-            
-            if success:
-                # Notify user
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=(
-                        f"🎉 ကျေးဇူးတင်ပါသည်။\n\n"
-                        f"သင်၏ Level ကို {level} အဖြစ် အတည်ပြုပြီးပါပြီ။\n"
-                        f"ယခု {level} ၀န်ဆောင်မှုများကို အသုံးပြုနိုင်ပါပြီ။"
-                    ),
-                    reply_markup=get_level_keyboard(level)
-                )
-                
-                # Update admin message
-                await query.edit_message_text(
-                    f"✅ Approved! User {user_id} is now {level} level.",
-                    reply_markup=None
-                )
+    text, reply_markup = render_review(update.effective_user.id, page=0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def review_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, action, argument=""):
+    """Handle bulk review buttons: select, page, approve or reject the selection"""
+    query = update.callback_query
+    admin = query.from_user
+    if admin.id not in Config.ADMIN_IDS:
+        await query.answer("Unauthorized action.", show_alert=True)
+        return
+    
+    flow = flow_states.get(admin.id)
+    selected = list(flow.get('review_selected', []))
+    page = None
+    notice = None
+    
+    if action == "x":
+        flow_states.update(admin.id, review_selected=[], review_page=0)
+        await query.answer()
+        await edit_message(query, "Review closed. Use /review to open it again.")
+        return
+    if action == "t":
+        if argument in selected:
+            selected.remove(argument)
+        else:
+            selected.append(argument)
+    elif action in ("s", "p") and argument.isdigit():
+        page = int(argument)
+        if action == "s":
+            size = Config.REVIEW_PAGE_SIZE
+            shown = [p['payment_id'] for p in storage.pending_payments()[page * size:(page + 1) * size]]
+            if all(payment_id in selected for payment_id in shown):
+                selected = [payment_id for payment_id in selected if payment_id not in shown]
             else:
-                await query.edit_message_text("❌ Error updating user level.")
-    
-    elif data.startswith("admin_reject_"):
-        # Format: admin_reject_USERID
-        parts = data.split("_")
-        if len(parts) >= 3:
-            user_id = int(parts[2])
-            
-            # Notify user
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="❌ သင်၏ payment အား အတည်မပြုနိုင်ပါ။ ကျေးဇူးပြု၍ ထပ်မံကြိုးစားပါ။"
-            )
-            
-            # Update admin message
-            await query.edit_message_text(
-                f"❌ Rejected! User {user_id} payment rejected.",
-                reply_markup=None
-            )
+                selected.extend(payment_id for payment_id in shown if payment_id not in selected)
+    elif action == "c":
+        selected = []
+    elif action in ("a", "r") and selected:
+        status = APPROVED if action == "a" else REJECTED
+        try:
+            resolved = resolve_selected(admin, selected, status, level=argument if action == "a" else None)
+        except Exception as e:
+            logger.error(f"Error in bulk review by admin {admin.id}: {e}")
+            await query.answer("❌ Error updating payments.", show_alert=True)
+            return
+        handled = {payment['payment_id'] for payment in resolved}
+        selected = [payment_id for payment_id in selected if payment_id not in handled]
+        notice = f"{'Approved' if status == APPROVED else 'Rejected'} {len(resolved)} payments."
+        if selected:
+            notice += f" {len(selected)} left selected (no matching level or already handled)."
+        if resolved:
+            context.application.create_task(finish_bulk_review(context.bot, admin, resolved))
+    
+    flow_states.update(admin.id, review_selected=selected)
+    await query.answer(notice)
+    text, reply_markup = render_review(admin.id, page)
+    await edit_message(query, text, reply_markup)
+
+# Reply keyboards for each level, built once
+LEVEL_KEYBOARDS = {
+    level: ReplyKeyboardMarkup([[f"{level} Services"]], resize_keyboard=True, one_time_keyboard=False)
+    for level in ("Gold", "Platinum", "Ruby")
+}
+NO_SERVICES_KEYBOARD = ReplyKeyboardMarkup(
+    [["No Services Available"]], resize_keyboard=True, one_time_keyboard=False
+)
 
 def get_level_keyboard(level):
     """Get reply keyboard for specific level"""
-    if level == "Gold":
-        keyboard = [["Gold Services"]]
-    elif level == "Platinum":
-        keyboard = [["Platinum Services"]]
-    elif level == "Ruby":
-        keyboard = [["Ruby Services"]]
-    else:
-        keyboard = [["No Services Available"]]
-    
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
+    return LEVEL_KEYBOARDS.get(level, NO_SERVICES_KEYBOARD)
 
 async def close_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Close service menu"""
-    await update.callback_query.edit_message_text(
+    await edit_message(
+        update.callback_query,
         "Service Menu: off\n\n"
-        "MeowAdvertisingService ၀န်ဆောင်မူများရယူရန် /service ကိုနိပ်ပါ။",
-        reply_markup=None
+        "MeowAdvertisingService ၀န်ဆောင်မူများရယူရန် /service ကိုနိပ်ပါ။"
+    )
+
+async def reload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /reload command - Force a refresh of the About/Payments cache"""
+    if update.effective_user.id not in Config.ADMIN_IDS:
+        await update.message.reply_text("Unauthorized action.")
+        return
+    
+    await asyncio.gather(about_cache.refresh(priority=USER), payments_cache.refresh(priority=USER))
+    await update.message.reply_text(
+        f"✅ Reloaded! About v{about_cache.version}, Payments v{payments_cache.version}."
+    )
+
+async def deliveries_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /deliveries command - Show per-admin screenshot delivery status"""
+    if update.effective_user.id not in Config.ADMIN_IDS:
+        await update.message.reply_text("Unauthorized action.")
+        return
+    
+    await update.message.reply_text(format_deliveries(admin_deliveries))
+
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /queue command - Show update queue depth and handler concurrency"""
+    if update.effective_user.id not in Config.ADMIN_IDS:
+        await update.message.reply_text("Unauthorized action.")
+        return
+    
+    stats = context.application.update_processor.stats()
+    await update.message.reply_text(
+        f"Queued or in progress: {context.application.update_queue.pending}\n"
+        f"Waiting: {stats['waiting']}\n"
+        f"Running: {stats['active']} / {stats['max_concurrent']}\n"
+        f"Users with pending updates: {stats['users']}\n"
+        f"Processed: {stats['processed']}"
+    )
+
+STATS_USAGE = "Usage: /stats [days], e.g. /stats 30 (default 7)."
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /stats command - Show payment counts and conversion per level, plan and method"""
+    if update.effective_user.id not in Config.ADMIN_IDS:
+        await update.message.reply_text("Unauthorized action.")
+        return
+    
+    days = context.args[0] if context.args else "7"
+    if not days.isdigit() or not 1 <= int(days) <= 366:
+        await update.message.reply_text(STATS_USAGE)
+        return
+    
+    await update.message.reply_text(format_stats(payment_stats.summary(int(days))))
+
+BROADCAST_USAGE = (
+    "Usage: /broadcast LEVEL message\n"
+    "or reply to a message with /broadcast LEVEL to send a copy of it.\n"
+    "LEVEL is Gold, Platinum, Ruby or all.\n"
+    "/broadcast shows progress, /broadcast cancel stops it."
+)
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /broadcast command - Send a message to every user of a level"""
+    if update.effective_user.id not in Config.ADMIN_IDS:
+        await update.message.reply_text("Unauthorized action.")
+        return
+    
+    # Split the raw text so the message keeps its line breaks
+    parts = update.message.text.split(maxsplit=2)
+    if len(parts) == 1:
+        broadcast = broadcasts.get()
+        await update.message.reply_text(format_broadcast(broadcast) if broadcast else BROADCAST_USAGE)
+        return
+    if parts[1].lower() == "cancel":
+        stopped = broadcasts.cancel()
+        await update.message.reply_text("Broadcast cancelled." if stopped else "No broadcast is running.")
+        return
+    
+    level = parts[1].capitalize()
+    if level not in LEVEL_KEYBOARDS and level != "All":
+        await update.message.reply_text(BROADCAST_USAGE)
+        return
+    source = update.message.reply_to_message
+    text = parts[2] if len(parts) > 2 else None
+    if source is None and not text:
+        await update.message.reply_text(BROADCAST_USAGE)
+        return
+    
+    try:
+        broadcast_id = broadcasts.start(
+            context.bot, update.effective_user.id, None if level == "All" else level,
+            text=None if source else text,
+            from_chat_id=source.chat_id if source else None,
+            message_id=source.message_id if source else None
+        )
+    except RuntimeError as e:
+        await update.message.reply_text(f"❌ {e}. Use /broadcast to see its progress.")
+        return
+    await update.message.reply_text(
+        f"📣 Broadcast #{broadcast_id} to {level} started. Use /broadcast to see its progress."
     )
 
 async def level_service_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -443,7 +824,11 @@ async def level_service_handler(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = update.effective_user.id
     
     # Get user level
-    user_info = get_user_info(user_id)
+    user_info = await get_user_info(user_id)
+    if user_info is None:
+        # Keep their keyboard; they can simply tap again later
+        await update.message.reply_text(USER_INFO_UNAVAILABLE)
+        return
     user_level = user_info['level']
     
     if text == "Gold Services" and user_level == "Gold":
@@ -479,43 +864,107 @@ async def level_service_handler(update: Update, context: ContextTypes.DEFAULT_TY
             reply_markup=ReplyKeyboardRemove()
         )
 
-# Flask routes for webhook
-@app.route('/')
-def index():
-    return "Meow Advertising Service Bot is running!"
+# Long-running jobs; not started through application.create_task because
+# Application.stop() waits for those to finish
+background_tasks = []
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Handle incoming updates from Telegram"""
-    update = Update.de_json(request.get_json(force=True), application.bot)
-    application.update_queue.put(update)
-    return 'OK'
+async def post_init(application: Application):
+    """Warm-load local data and start background jobs; never waits for Sheets"""
+    if shared_state:
+        shared_state.renew_lease()
+        for cache in (about_cache, payments_cache):
+            shared_state.subscribe(f"sheet:{cache.name}", lambda topic, cache=cache: cache.invalidate())
+        background_tasks.append(asyncio.create_task(shared_state.run()))
+    await storage.start()
+    await asyncio.gather(about_cache.warm_load(), payments_cache.warm_load())
+    background_tasks.append(asyncio.create_task(connect_sheets()))
+    background_tasks.append(asyncio.create_task(run_cache_refresher([about_cache, payments_cache])))
+    background_tasks.extend(asyncio.create_task(job) for job in storage.jobs())
+    background_tasks.append(asyncio.create_task(flow_states.run()))
+    if not shared_state or shared_state.is_leader:
+        broadcasts.resume(application.bot)
 
-def run_flask():
-    """Run Flask server for webhook"""
-    app.run(host='0.0.0.0', port=Config.PORT)
+async def post_shutdown(application: Application):
+    """Release background resources once the bot has stopped"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await broadcasts.close()
+    await storage.close()
+    flow_states.close()
+    payment_stats.close()
+    screenshot_index.close()
+    if shared_state:
+        shared_state.close()
+    sheets_gateway.shutdown()
 
-def main():
-    """Start the bot"""
-    # Create Application
-    application = Application.builder().token(Config.BOT_TOKEN).build()
+def build_application(request=None):
+    """Create the Application with all handlers registered"""
+    builder = (
+        Application.builder()
+        .token(Config.BOT_TOKEN)
+        .update_queue(UpdateQueue())
+        .concurrent_updates(PerUserUpdateProcessor(Config.CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if Config.WEBHOOK_URL or request is not None:
+        # The webhook server (or the caller) feeds the update queue itself
+        builder = builder.updater(None)
+    # Time every Bot API call; same pool size PTB uses by default
+    builder = builder.request(InstrumentedRequest(request or HTTPXRequest(connection_pool_size=256)))
+    application = builder.build()
     
     # Add handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("service", service_menu))
+    application.add_handler(CommandHandler("start", instrument_handler(start)))
+    application.add_handler(CommandHandler("service", instrument_handler(service_menu)))
+    application.add_handler(CommandHandler("reload", instrument_handler(reload_command)))
+    application.add_handler(CommandHandler("deliveries", instrument_handler(deliveries_command)))
+    application.add_handler(CommandHandler("queue", instrument_handler(queue_command)))
+    application.add_handler(CommandHandler("broadcast", instrument_handler(broadcast_command)))
+    application.add_handler(CommandHandler("stats", instrument_handler(stats_command)))
+    application.add_handler(CommandHandler("review", instrument_handler(review_command)))
     application.add_handler(CallbackQueryHandler(button_callback))
-    application.add_handler(CallbackQueryHandler(admin_callback, pattern="^admin_"))
-    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, level_service_handler))
+    
+    # Inline buttons; user menus are answered (and debounced) by the router,
+    # admin buttons answer with their own alerts
+    for code, callback, fields, answer in (
+        (ABOUT, show_about, (), True),
+        (USER_INFO, show_user_info, (), True),
+        (PAYMENT, show_payment_methods, (), True),
+        (CLOSE_MENU, close_menu, (), True),
+        (SERVICE, service_menu, (), True),
+        (PLAN, show_payment_options, (str,), True),
+        (METHOD, request_payment_screenshot, (str, str), True),
+        (ADMIN, admin_callback, (str, str, str), False),
+        (LEGACY_ADMIN, legacy_admin_callback, (str, str, str), False),
+        (REVIEW, review_callback, (str, str), False),
+    ):
+        callback_router.route(code, instrument_handler(callback), fields, answer=answer)
+    for prefix in {data.partition("_")[0] for data in LEGACY_MENU_CALLBACKS} | {"pay", "method", "admin", "review"}:
+        callback_router.legacy(prefix, legacy_callback)
+    application.add_handler(MessageHandler(filters.PHOTO, instrument_handler(handle_photo)))
+    application.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND, instrument_handler(level_service_handler))
+    )
+    watch_application(application)
+    return application
+
+def main():
+    """Start the bot"""
+    Config.validate_config()
+    if Config.WEBHOOK_URL and Config.WEB_WORKERS > 1 and not Config.WORKER_ID:
+        # This process only supervises; each worker runs main() itself
+        run_workers(Config.WEB_WORKERS)
+        return
+    
+    application = build_application()
     
     # Set up webhook if WEBHOOK_URL is configured
     if Config.WEBHOOK_URL:
-        application.run_webhook(
-            listen="0.0.0.0",
-            port=Config.PORT,
-            url_path="webhook",
-            webhook_url=f"{Config.WEBHOOK_URL}/webhook"
-        )
+        # Telegram only accepts updates we registered with this token
+        secret_token = Config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        asyncio.run(serve_webhook(application, secret_token))
     else:
         # Run with polling (for development)
         print("Starting bot with polling...")
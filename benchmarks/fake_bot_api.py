@@ -0,0 +1,86 @@
+"""Local stand-in for the Telegram Bot API.
+
+``FakeBotRequest`` plugs into ``ApplicationBuilder.request()`` and answers
+every Bot API method in-process after a configurable delay, so handlers run
+exactly as in production without any network access.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "MeowBench", "username": "meow_bench_bot"}
+
+
+class FakeBotRequest(BaseRequest):
+    """Answers Bot API calls locally with ``latency`` seconds (+/- jitter) of delay"""
+
+    def __init__(self, latency=0.03, jitter=0.5, retry_after_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after_rate = retry_after_rate
+        self.calls = Counter()
+        self.latencies = {}
+        self._message_ids = itertools.count(1000)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] += 1
+
+        started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        self.latencies.setdefault(api_method, []).append(time.perf_counter() - started)
+
+        if api_method.startswith("send") and random.random() < self.retry_after_rate:
+            return 429, json.dumps({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            }).encode()
+
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    def _message(self, params):
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        if "photo" in params:
+            message["photo"] = [{"file_id": str(params["photo"]), "file_unique_id": "u", "width": 1, "height": 1}]
+        # Only inline keyboards are echoed back on the message by Telegram
+        markup = params.get("reply_markup")
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        return message
+
+    def _result(self, api_method, params):
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method == "getChat":
+            chat_id = int(params["chat_id"])
+            return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}", "username": f"user{chat_id}"}
+        if api_method.startswith("send") or api_method.startswith("edit"):
+            return self._message(params)
+        # answerCallbackQuery, setWebhook, deleteWebhook, ...
+        return True
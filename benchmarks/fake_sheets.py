@@ -0,0 +1,143 @@
+"""In-memory fake of the gspread Spreadsheet/Worksheet surface the bot uses.
+
+Every call sleeps for a configurable latency and can fail with a 429 quota
+error at a configurable rate, so ``SheetsClient`` retries and the bot's
+caches, queues and limiters behave as they would against Google.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import gspread
+
+
+class FakeResponse:
+    """Just enough of ``requests.Response`` for ``gspread.exceptions.APIError``"""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": self.text, "status": "RESOURCE_EXHAUSTED"}}
+
+
+class FakeSpreadsheet:
+    def __init__(self, latency=0.15, jitter=0.5, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._worksheets = {}
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        """gspread's signature; ``rows`` and ``cols`` are the grid size, so the sheet starts empty"""
+        self._call("add_worksheet")
+        with self._lock:
+            if title in self._worksheets:
+                raise gspread.exceptions.APIError(FakeResponse(400, f"A sheet named {title} already exists"))
+            return self.fill_worksheet(title, [])
+
+    def fill_worksheet(self, title, rows):
+        """Set up a worksheet with ``rows`` without counting a call"""
+        ws = FakeWorksheet(self, title, rows)
+        self._worksheets[title] = ws
+        return ws
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        if random.random() < self.error_rate:
+            raise gspread.exceptions.APIError(FakeResponse(429, "Quota exceeded"))
+
+    def worksheets(self):
+        self._call("worksheets")
+        return list(self._worksheets.values())
+
+    def worksheet(self, title):
+        self._call("worksheet")
+        try:
+            return self._worksheets[title]
+        except KeyError:
+            raise gspread.exceptions.WorksheetNotFound(title)
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [list(row) for row in rows]
+
+    def _call(self, operation):
+        self.spreadsheet._call(f"{self.title}.{operation}")
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        return [list(row) for row in self.rows]
+
+    def get_values(self, range_name):
+        self._call("get_values")
+        # Only whole-column ranges such as "A:E" are needed by the bot
+        first, last = range_name.split(":")
+        start, end = _column_number(first) - 1, _column_number(last)
+        return [row[start:end] for row in self.rows]
+
+    def batch_update(self, data):
+        self._call("batch_update")
+        with self.spreadsheet._lock:
+            for item in data:
+                match = re.match(r"([A-Z]+)(\d+)", item["range"])
+                col, row = _column_number(match.group(1)) - 1, int(match.group(2)) - 1
+                for r_offset, values in enumerate(item["values"]):
+                    target = self.rows[row + r_offset]
+                    target.extend([""] * (col + len(values) - len(target)))
+                    target[col:col + len(values)] = values
+        return {"totalUpdatedCells": len(data)}
+
+    def append_rows(self, rows, **kwargs):
+        self._call("append_rows")
+        with self.spreadsheet._lock:
+            first = len(self.rows) + 1
+            self.rows.extend(list(row) for row in rows)
+            last = len(self.rows)
+        return {"updates": {"updatedRange": f"{self.title}!A{first}:Z{last}"}}
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row], **kwargs)
+
+
+def make_spreadsheet(users=1000, latency=0.15, error_rate=0.0):
+    """Spreadsheet with the bot's worksheets and ``users`` existing users"""
+    spreadsheet = FakeSpreadsheet(latency=latency, error_rate=error_rate)
+    levels = ["Gold", "Platinum", "Ruby", ""]
+    spreadsheet.fill_worksheet("Users", [["User ID", "Username", "Name", "Joined", "Level"]] + [
+        [str(500000 + i), f"user{i}", f"User {i}", "1700000000", levels[i % len(levels)]]
+        for i in range(users)
+    ])
+    spreadsheet.fill_worksheet("About", [
+        ["Meow Advertising Service"],
+        ["We promote your channel to thousands of cat lovers."],
+        ["Contact @meow_admin for custom campaigns."],
+    ])
+    spreadsheet.fill_worksheet("Payments", [
+        ["Plan", "Price", "Duration"],
+        ["Gold", "5000 Ks", "1 month"],
+        ["Platinum", "12000 Ks", "3 months"],
+        ["Ruby", "20000 Ks", "6 months"],
+    ])
+    spreadsheet.fill_worksheet("PaymentRecords", [
+        ["Payment ID", "User ID", "Username", "Name", "Plan", "Method", "Status", "Level", "Admin", "Time"]
+    ])
+    return spreadsheet
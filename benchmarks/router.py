@@ -0,0 +1,111 @@
+"""Microbenchmark of callback query dispatch.
+
+Times how long it takes to pick the handler (and decode the arguments) for
+a mix of callback data, comparing ``CallbackRouter.resolve`` against the
+if/elif chain of ``==``/``startswith`` checks it replaced, and reports the
+largest encoded callback data against Telegram's 64-byte limit.
+
+    python -m benchmarks.router --iterations 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000, help="dispatches per variant")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def linear_chain(data):
+    """The old button_callback dispatch, minus the handler calls"""
+    if data == "about":
+        return "show_about", ()
+    elif data == "user_info":
+        return "show_user_info", ()
+    elif data == "payment":
+        return "show_payment_methods", ()
+    elif data == "close_menu":
+        return "close_menu", ()
+    elif data.startswith("pay_"):
+        return "show_payment_options", (data.replace("pay_", ""),)
+    elif data.startswith("method_"):
+        parts = data.split("_")
+        return "request_payment_screenshot", (parts[1], "_".join(parts[2:]))
+    elif data == "back_to_service":
+        return "service_menu", ()
+    elif data == "back_to_payment":
+        return "show_payment_methods", ()
+    elif data.startswith("admin_"):
+        parts = data.split("_")
+        return "admin_callback", tuple(parts[1:4])
+    return None
+
+
+def build_router():
+    """The bot's own router, with every route and legacy translation registered"""
+    import advertising_service as bot
+    from benchmarks.fake_bot_api import FakeBotRequest
+
+    bot.build_application(request=FakeBotRequest())
+    return bot.callback_router
+
+
+def workload(count):
+    """(old data, new data) pairs in roughly the proportions users tap them"""
+    import advertising_service as bot
+    from callback_router import callback_data, short_key
+
+    plans = ["Gold", "Platinum", "Ruby", "Ruby_6_months"]
+    pairs = [
+        ("about", callback_data(bot.ABOUT)),
+        ("user_info", callback_data(bot.USER_INFO)),
+        ("payment", callback_data(bot.PAYMENT)),
+        ("back_to_service", callback_data(bot.SERVICE)),
+        ("back_to_payment", callback_data(bot.PAYMENT)),
+        ("close_menu", callback_data(bot.CLOSE_MENU)),
+    ] * 4
+    for plan in plans:
+        pairs.append((f"pay_{plan}", callback_data(bot.PLAN, short_key(plan))))
+        for method in ("KBZ", "Wave"):
+            pairs.append((f"method_{method}_{plan}", callback_data(bot.METHOD, method, short_key(plan))))
+    payment_id = f"p{random.getrandbits(32):08x}"
+    pairs.append((f"admin_approve_{payment_id}_Platinum",
+                  callback_data(bot.ADMIN, "approve", payment_id, "Platinum")))
+    pairs.append((f"admin_reject_{payment_id}", callback_data(bot.ADMIN, "reject", payment_id)))
+    return [random.choice(pairs) for _ in range(count)]
+
+
+def timed(label, func, items):
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32}{elapsed / len(items) * 1e9:>10.0f} ns/dispatch")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from benchmarks import run
+    run.configure_environment(run.parse_args([]))
+    router = build_router()
+    pairs = workload(args.iterations)
+    old = [old for old, _ in pairs]
+    new = [new for _, new in pairs]
+
+    timed("if/elif chain (old data)", linear_chain, old)
+    timed("router (new data)", router.resolve, new)
+    timed("router (old data, translated)", router.resolve, old)
+
+    longest = max(new, key=lambda data: len(data.encode("utf-8")))
+    print(f"\nLongest callback data: {len(longest.encode('utf-8'))} bytes ({longest!r}), limit 64")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Offline load benchmark for the bot's handlers.
+
+Replays a realistic mix of menu browsing, payment screenshots and admin
+approvals through the real ``Application`` and handlers, with the Bot API
+and Google Sheets replaced by local fakes. Reports throughput, p50/p95/p99
+latency per handler and Sheets calls per update.
+
+    python -m benchmarks.run --users 300 --sheets-latency 0.2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+ADMIN_IDS = [9001, 9002, 9003]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="virtual users to simulate")
+    parser.add_argument("--mix", default="browse=70,purchase=25,approve=5",
+                        help="relative weights of the browse/purchase/approve scenarios")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which users arrive")
+    parser.add_argument("--think", type=float, default=0.2, help="max think time between a user's actions")
+    parser.add_argument("--concurrency", type=int, default=32, help="CONCURRENT_UPDATES for the run")
+    parser.add_argument("--existing-users", type=int, default=5000, help="rows in the fake Users sheet")
+    parser.add_argument("--sheets-latency", type=float, default=0.15, help="seconds per fake Sheets call")
+    parser.add_argument("--sheets-error-rate", type=float, default=0.0, help="fraction of Sheets calls failing with 429")
+    parser.add_argument("--sheets-quota", type=int, default=60, help="Sheets requests per minute (read and write)")
+    parser.add_argument("--bot-latency", type=float, default=0.03, help="seconds per fake Bot API call")
+    parser.add_argument("--bot-retry-after-rate", type=float, default=0.0, help="fraction of sends answered with 429")
+    parser.add_argument("--storage", choices=["sheets", "sqlite"], default="sheets")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    """Must run before the bot modules are imported; Config reads env at import"""
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCHMARK",
+        "SHEET_ID": "benchmark",
+        "GOOGLE_SHEET_KEY": json.dumps({"type": "service_account"}),
+        "ADMIN_IDS": ",".join(str(admin_id) for admin_id in ADMIN_IDS),
+        "WEBHOOK_URL": "",
+        "DATA_DIR": tempfile.mkdtemp(prefix="meow-bench-"),
+        "CONCURRENT_UPDATES": str(args.concurrency),
+        "SHEETS_READ_QUOTA": str(args.sheets_quota),
+        "SHEETS_WRITE_QUOTA": str(args.sheets_quota),
+        "STORAGE_BACKEND": args.storage,
+    })
+
+
+class UpdateFactory:
+    """Builds raw update dicts the way Telegram would send them"""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id, **fields):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+        }
+        message.update(fields)
+        return message
+
+    def text(self, user_id, text):
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, **fields)}
+
+    def photo(self, user_id):
+        file_id = f"photo-{user_id}-{random.getrandbits(32)}"
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, photo=[
+            {"file_id": file_id, "file_unique_id": file_id, "width": 720, "height": 1280}
+        ])}
+
+    def callback(self, user_id, data, **message_fields):
+        message_fields.setdefault("text", "Meow Advertising Service Menu:")
+        message = self._message(user_id, **message_fields)
+        message["from"] = {"id": 100000, "is_bot": True, "first_name": "MeowBench"}
+        return {"update_id": next(self._update_ids), "callback_query": {
+            "id": str(random.getrandbits(48)),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": message,
+        }}
+
+
+def build_scripts(args, factory):
+    """One list of updates per virtual user, following the requested mix.
+
+    An entry may also be a function returning the update, for updates that
+    depend on what happened earlier in the run (such as a payment ID).
+    """
+    import advertising_service as bot
+    from callback_router import callback_data, short_key
+
+    weights = dict(item.split("=") for item in args.mix.split(","))
+    scenarios = list(weights)
+    scenario_weights = [float(weights[name]) for name in scenarios]
+    plans = ["Gold", "Platinum", "Ruby"]
+
+    scripts = []
+    purchasers = []
+    for n in range(args.users):
+        user_id = 700000 + n
+        scenario = random.choices(scenarios, scenario_weights)[0]
+        if scenario == "browse":
+            script = [
+                factory.text(user_id, "/service"),
+                factory.callback(user_id, callback_data(bot.ABOUT)),
+                factory.callback(user_id, callback_data(bot.SERVICE)),
+                factory.callback(user_id, callback_data(bot.USER_INFO)),
+                factory.callback(user_id, callback_data(bot.SERVICE)),
+                factory.callback(user_id, callback_data(bot.PAYMENT)),
+                factory.callback(user_id, callback_data(bot.CLOSE_MENU)),
+                factory.text(user_id, f"{random.choice(plans)} Services"),
+            ]
+        elif scenario == "purchase":
+            plan = random.choice(plans)
+            method = random.choice(["KBZ", "Wave"])
+            script = [
+                factory.text(user_id, "/service"),
+                factory.callback(user_id, callback_data(bot.PAYMENT)),
+                factory.callback(user_id, callback_data(bot.PLAN, short_key(plan))),
+                factory.callback(user_id, callback_data(bot.METHOD, method, short_key(plan))),
+                factory.photo(user_id),
+            ]
+            purchasers.append((user_id, plan))
+        else:
+            # Admin taps approve/reject on a screenshot that is gone (or
+            # was never seen by this process)
+            admin_id = random.choice(ADMIN_IDS)
+            target = f"p{random.getrandbits(32):08x}"
+            if random.random() < 0.8:
+                data = callback_data(bot.ADMIN, "approve", target, random.choice(plans))
+            else:
+                data = callback_data(bot.ADMIN, "reject", target)
+            script = [factory.callback(admin_id, data, caption="Payment Screenshot", text=None)]
+        scripts.append(script)
+
+    # Purchases get approved by an admin a little later
+    def approval(user_id, plan, admin_id):
+        payment = bot.storage.latest_pending_payment(user_id)
+        payment_id = payment['payment_id'] if payment else "00000000"
+        return factory.callback(admin_id, callback_data(bot.ADMIN, "approve", payment_id, plan),
+                                caption="Payment Screenshot", text=None)
+
+    for user_id, plan in purchasers:
+        scripts.append([lambda user_id=user_id, plan=plan, admin_id=random.choice(ADMIN_IDS):
+                        approval(user_id, plan, admin_id)])
+    return scripts
+
+
+class Results:
+    def __init__(self):
+        self.handler_latency = defaultdict(list)
+        self.end_to_end = []
+        self.errors = Counter()
+        self.enqueued_at = {}
+
+
+def timer(callback, results, end_to_end):
+    """``callback`` recording its latency and errors (and, with ``end_to_end``, the update's)"""
+    name = callback.__name__
+
+    async def timed(update, context, *args):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context, *args)
+        except Exception:
+            results.errors[name] += 1
+            raise
+        finally:
+            finished = time.perf_counter()
+            results.handler_latency[name].append(finished - started)
+            enqueued = results.enqueued_at.pop(update.update_id, None) if end_to_end else None
+            if enqueued is not None:
+                results.end_to_end.append(finished - enqueued)
+
+    return timed
+
+
+def instrument(application, results, router):
+    """Wrap every registered handler callback with a timer.
+
+    Inline buttons all reach PTB through one handler (``button_callback``),
+    so the routes of ``router`` are timed too, each under its own name.
+    """
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timer(handler.callback, results, end_to_end=True)
+    for route in router.routes():
+        route.handler = timer(route.handler, results, end_to_end=False)
+
+    async def swallow_errors(update, context):
+        # Already counted per handler; keeps the report readable
+        pass
+
+    application.add_error_handler(swallow_errors)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def replay(application, scripts, args, results):
+    from telegram import Update
+
+    async def virtual_user(script):
+        await asyncio.sleep(random.uniform(0, args.ramp))
+        for raw in script:
+            update = Update.de_json(raw() if callable(raw) else raw, application.bot)
+            results.enqueued_at[update.update_id] = time.perf_counter()
+            await application.update_queue.put(update)
+            await asyncio.sleep(random.uniform(0, args.think))
+
+    await asyncio.gather(*(virtual_user(script) for script in scripts))
+    while application.update_queue.pending:
+        await asyncio.sleep(0.01)
+
+
+def report(args, results, elapsed, total_updates, spreadsheet, bot_request):
+    sheets_calls = sum(spreadsheet.calls.values())
+    lines = [
+        f"Updates: {total_updates} in {elapsed:.2f}s -> {total_updates / elapsed:.1f} updates/s "
+        f"(concurrency {args.concurrency}, storage {args.storage})",
+        "",
+        f"{'handler':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}",
+    ]
+    rows = sorted(results.handler_latency.items())
+    rows.append(("(end to end)", results.end_to_end))
+    for name, values in rows:
+        lines.append(
+            f"{name:<28}{len(values):>7}{percentile(values, 0.50) * 1000:>10.1f}"
+            f"{percentile(values, 0.95) * 1000:>10.1f}{percentile(values, 0.99) * 1000:>10.1f}"
+            f"{results.errors.get(name, 0):>8}"
+        )
+    lines += ["", f"Sheets calls: {sheets_calls} ({sheets_calls / max(total_updates, 1):.3f} per update)"]
+    lines += [f"  {operation}: {count}" for operation, count in sorted(spreadsheet.calls.items())]
+    lines += ["", f"Bot API calls: {sum(bot_request.calls.values())}"]
+    lines += [f"  {method}: {count}" for method, count in sorted(bot_request.calls.items())]
+    print("\n".join(lines))
+
+    return {
+        "updates": total_updates,
+        "elapsed": elapsed,
+        "throughput": total_updates / elapsed,
+        "handlers": {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "errors": results.errors.get(name, 0),
+            }
+            for name, values in rows
+        },
+        "sheets_calls": dict(spreadsheet.calls),
+        "sheets_calls_per_update": sheets_calls / max(total_updates, 1),
+        "bot_api_calls": dict(bot_request.calls),
+    }
+
+
+async def run(args):
+    import advertising_service as bot
+    from benchmarks.fake_bot_api import FakeBotRequest
+    from benchmarks.fake_sheets import make_spreadsheet
+    from sheets_client import SheetsClient
+
+    spreadsheet = make_spreadsheet(
+        users=args.existing_users, latency=args.sheets_latency, error_rate=args.sheets_error_rate
+    )
+    bot.sheets = SheetsClient(spreadsheet)
+    bot_request = FakeBotRequest(latency=args.bot_latency, retry_after_rate=args.bot_retry_after_rate)
+
+    application = bot.build_application(request=bot_request)
+    results = Results()
+    instrument(application, results, bot.callback_router)
+
+    factory = UpdateFactory()
+    scripts = build_scripts(args, factory)
+    total_updates = sum(len(script) for script in scripts)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    started = time.perf_counter()
+    try:
+        await replay(application, scripts, args, results)
+        elapsed = time.perf_counter() - started
+    finally:
+        await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+    return report(args, results, elapsed, total_updates, spreadsheet, bot_request)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    logging.basicConfig(level=logging.WARNING)
+    summary = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import logging
+import os
+import sqlite3
+import time
+
+from telegram.error import BadRequest, Forbidden
+
+from config import Config
+from send_limiter import BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class BroadcastManager:
+    """Sends a message to every user of a level, resumably.
+
+    Recipients are read from storage in user_id order, one batch at a time.
+    Each batch is sent concurrently as ``BACKGROUND`` sends on the bot's
+    shared ``SendLimiter``, so replies to users keep priority within the
+    one global rate, then the last user_id and the delivered/blocked/failed
+    counts are checkpointed to SQLite. A restart resumes after the last
+    checkpoint, so at most one batch is sent twice.
+    """
+
+    def __init__(self, storage, limiter, path=None, batch_size=None):
+        self.storage = storage
+        self.limiter = limiter
+        self.path = path or Config.BROADCAST_PATH
+        self.batch_size = batch_size or Config.BROADCAST_BATCH_SIZE
+        self._db = None
+        self._task = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    level TEXT,
+                    text TEXT,
+                    from_chat_id INTEGER,
+                    message_id INTEGER,
+                    admin_id INTEGER,
+                    status TEXT NOT NULL,
+                    last_user_id INTEGER,
+                    delivered INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created REAL,
+                    finished REAL
+                )
+            """)
+        return self._db
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def get(self, broadcast_id=None):
+        """The given broadcast, or the most recent one"""
+        db = self._connect()
+        if broadcast_id is None:
+            row = db.execute("SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1").fetchone()
+        else:
+            row = db.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+        return dict(row) if row else None
+
+    def start(self, bot, admin_id, level, text=None, from_chat_id=None, message_id=None):
+        """Start broadcasting ``text`` (or a copy of a message) to ``level`` (None for everyone)"""
+        running = self._connect().execute(
+            "SELECT 1 FROM broadcasts WHERE status = ?", (RUNNING,)
+        ).fetchone()
+        if self.running or running:
+            raise RuntimeError("A broadcast is already running")
+        cursor = self._connect().execute(
+            "INSERT INTO broadcasts (level, text, from_chat_id, message_id, admin_id, status, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (level, text, from_chat_id, message_id, admin_id, RUNNING, time.time())
+        )
+        self._task = asyncio.create_task(self._run(bot, cursor.lastrowid))
+        return cursor.lastrowid
+
+    def resume(self, bot):
+        """Continue a broadcast that was interrupted by a restart.
+
+        With several workers only the leader should call this.
+        """
+        row = self._connect().execute(
+            "SELECT id FROM broadcasts WHERE status = ? ORDER BY id LIMIT 1", (RUNNING,)
+        ).fetchone()
+        if row and not self.running:
+            logger.info(f"Resuming broadcast {row['id']}")
+            self._task = asyncio.create_task(self._run(bot, row['id']))
+
+    def cancel(self):
+        """Cancel the running broadcast, even if another worker is sending it"""
+        cursor = self._connect().execute(
+            "UPDATE broadcasts SET status = ?, finished = ? WHERE status = ?", (CANCELLED, time.time(), RUNNING)
+        )
+        if self.running:
+            self._task.cancel()
+        return cursor.rowcount > 0
+
+    async def close(self):
+        """Stop sending; a running broadcast stays RUNNING and resumes next start"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _status(self, broadcast_id):
+        return self._connect().execute(
+            "SELECT status FROM broadcasts WHERE id = ?", (broadcast_id,)
+        ).fetchone()[0]
+
+    async def _run(self, bot, broadcast_id):
+        try:
+            await self._send_all(bot, broadcast_id)
+        except Exception as e:
+            # Without this the row would stay RUNNING and block new broadcasts
+            logger.error(f"Broadcast {broadcast_id} failed: {e}")
+            self._connect().execute(
+                "UPDATE broadcasts SET status = ?, finished = ? WHERE id = ? AND status = ?",
+                (FAILED, time.time(), broadcast_id, RUNNING)
+            )
+            await self._report(bot, self.get(broadcast_id), "failed")
+
+    async def _send_all(self, bot, broadcast_id):
+        broadcast = self.get(broadcast_id)
+        attempt = 0
+        while not await self.storage.ensure_loaded():
+            # Sending now would find no users and finish with 0 delivered
+            if self._status(broadcast_id) != RUNNING:
+                return
+            attempt += 1
+            delay = min(Config.SHEETS_CONNECT_MAX_BACKOFF, 2 ** attempt)
+            logger.warning(f"Users are not loaded yet, broadcast {broadcast_id} retries in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+        while True:
+            if self._status(broadcast_id) != RUNNING:
+                # Cancelled, possibly from another worker
+                return
+            batch = list(itertools.islice(
+                self.storage.iter_users(broadcast['level'], after=broadcast['last_user_id']),
+                self.batch_size
+            ))
+            if not batch:
+                break
+            results = await asyncio.gather(*(self._send(bot, broadcast, r.user_id) for r in batch))
+            broadcast['last_user_id'] = batch[-1].user_id
+            for result in results:
+                broadcast[result] += 1
+            self._connect().execute(
+                "UPDATE broadcasts SET last_user_id = ?, delivered = ?, blocked = ?, failed = ? WHERE id = ?",
+                (broadcast['last_user_id'], broadcast['delivered'], broadcast['blocked'],
+                 broadcast['failed'], broadcast_id)
+            )
+
+        self._connect().execute(
+            "UPDATE broadcasts SET status = ?, finished = ? WHERE id = ?", (DONE, time.time(), broadcast_id)
+        )
+        broadcast.update(status=DONE)
+        logger.info(f"Broadcast {broadcast_id} finished: {format_broadcast(broadcast)}")
+        await self._report(bot, broadcast, "finished")
+
+    async def _report(self, bot, broadcast, outcome):
+        try:
+            await self.limiter.send(broadcast['admin_id'], lambda: bot.send_message(
+                chat_id=broadcast['admin_id'], text=f"📣 Broadcast {outcome}.\n{format_broadcast(broadcast)}"
+            ))
+        except Exception as e:
+            logger.error(f"Error reporting broadcast {broadcast['id']}: {e}")
+
+    async def _send(self, bot, broadcast, user_id):
+        """Deliver to one user; returns the counter to bump"""
+        if broadcast['text'] is not None:
+            send = lambda: bot.send_message(chat_id=user_id, text=broadcast['text'])
+        else:
+            send = lambda: bot.copy_message(
+                chat_id=user_id, from_chat_id=broadcast['from_chat_id'], message_id=broadcast['message_id']
+            )
+        try:
+            await self.limiter.send(user_id, send, priority=BACKGROUND)
+            return 'delivered'
+        except Forbidden:
+            # Blocked the bot or deactivated their account
+            return 'blocked'
+        except BadRequest as e:
+            logger.info(f"Broadcast to {user_id} rejected: {e}")
+            return 'failed'
+        except Exception as e:
+            logger.warning(f"Broadcast to {user_id} failed: {e}")
+            return 'failed'
+
+
+def format_broadcast(broadcast):
+    """Text summary of a broadcast for admins"""
+    return (
+        f"#{broadcast['id']} to {broadcast['level'] or 'all users'}: {broadcast['status']}\n"
+        f"Delivered: {broadcast['delivered']}\n"
+        f"Blocked: {broadcast['blocked']}\n"
+        f"Failed: {broadcast['failed']}"
+    )
@@ -0,0 +1,64 @@
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callback_router import callback_data
+
+# Callback data: rv:t:PAYMENTID toggles one payment, rv:s:PAGE toggles a
+# whole page, rv:p:PAGE turns the page, rv:a:LEVEL approves the selection
+# (rv:a:plan: each at the level of its plan), rv:r rejects it, rv:c
+# clears it and rv:x closes the view
+REVIEW = "rv"
+AS_PLAN = "plan"
+
+
+def page_count(total, page_size):
+    return max(1, -(-total // page_size))
+
+
+def review_page(pending, selected, page, page_size, levels):
+    """Text and keyboard for one page of pending payments; returns (text, markup, page)"""
+    pages = page_count(len(pending), page_size)
+    page = min(max(page, 0), pages - 1)
+    shown = pending[page * page_size:(page + 1) * page_size]
+
+    lines = [
+        f"📋 Pending payments: {len(pending)} (page {page + 1}/{pages})",
+        f"Selected: {len(selected)}",
+        ""
+    ]
+    keyboard = []
+    for payment in shown:
+        mark = "☑️" if payment['payment_id'] in selected else "⬜"
+        submitted = time.strftime("%m-%d %H:%M", time.localtime(payment['created'] or 0))
+        lines.append(
+            f"{mark} {payment['payment_id']} · {payment['plan']} · {payment['method']} · "
+            f"{payment['name']} (@{payment['username']}, {payment['user_id']}) · {submitted}"
+        )
+        keyboard.append([InlineKeyboardButton(
+            f"{mark} {payment['name']} · {payment['plan']} · {payment['method']}",
+            callback_data=callback_data(REVIEW, "t", payment['payment_id'])
+        )])
+    if not shown:
+        lines.append("Nothing to review. 🎉")
+
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=callback_data(REVIEW, "p", page - 1)))
+    if shown:
+        navigation.append(InlineKeyboardButton("Select page", callback_data=callback_data(REVIEW, "s", page)))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=callback_data(REVIEW, "p", page + 1)))
+    if navigation:
+        keyboard.append(navigation)
+    if selected:
+        keyboard.append([
+            InlineKeyboardButton(f"✅ {level}", callback_data=callback_data(REVIEW, "a", level)) for level in levels
+        ])
+        keyboard.append([
+            InlineKeyboardButton("✅ As plan", callback_data=callback_data(REVIEW, "a", AS_PLAN)),
+            InlineKeyboardButton("❌ Reject", callback_data=callback_data(REVIEW, "r")),
+            InlineKeyboardButton("Clear", callback_data=callback_data(REVIEW, "c"))
+        ])
+    keyboard.append([InlineKeyboardButton("Close", callback_data=callback_data(REVIEW, "x"))])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard), page
@@ -0,0 +1,124 @@
+import hashlib
+
+from metrics import CALLBACKS_DEBOUNCED
+
+# Telegram rejects buttons whose callback data is longer than this (in bytes)
+MAX_CALLBACK_DATA = 64
+SEPARATOR = ":"
+
+
+def _escape(value):
+    return str(value).replace("%", "%25").replace(SEPARATOR, "%3A")
+
+
+def _unescape(value):
+    return value.replace("%3A", SEPARATOR).replace("%25", "%")
+
+
+def callback_data(code, *args):
+    """Encode an action and its arguments as ``code:arg:arg``.
+
+    Arguments may contain any character, including underscores and the
+    separator; raises ValueError if the result exceeds Telegram's limit.
+    """
+    data = SEPARATOR.join([code] + [_escape(arg) for arg in args])
+    if len(data.encode("utf-8")) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data for {code} is longer than {MAX_CALLBACK_DATA} bytes")
+    return data
+
+
+def short_key(name):
+    """Fixed-size key for free text (e.g. a plan name) that has to fit in callback data"""
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+
+
+class Route:
+    __slots__ = ("code", "handler", "fields", "answer", "_splits", "_convert")
+
+    def __init__(self, code, handler, fields, answer):
+        self.code = code
+        self.handler = handler
+        self.fields = fields
+        self.answer = answer
+        self._splits = len(fields) - 1
+        # Text arguments (the common case) need no conversion at all
+        self._convert = any(field is not str for field in fields)
+
+    def decode(self, rest):
+        """Arguments for the handler; missing trailing ones are left to its defaults"""
+        if not rest or not self.fields:
+            return ()
+        values = rest.split(SEPARATOR, self._splits)
+        if "%" in rest:
+            values = [_unescape(value) for value in values]
+        if self._convert:
+            return tuple([field(value) for field, value in zip(self.fields, values)])
+        return tuple(values)
+
+
+class CallbackRouter:
+    """Dispatches callback queries by the code in front of their data.
+
+    Routes live in a dict keyed by code, so every query costs one split and
+    one lookup whatever the number of buttons. Data written before codes
+    were introduced (``pay_Gold``, ``admin_approve_...``) is translated by
+    legacy parsers, looked up the same way by the text before the first
+    underscore.
+    """
+
+    def __init__(self, debouncer=None):
+        self.debouncer = debouncer
+        self._routes = {}
+        self._legacy = {}
+
+    def route(self, code, handler, fields=(), answer=True):
+        """Send ``code`` queries to ``handler(update, context, *args)``.
+
+        ``fields`` convert each argument (e.g. ``(str, int)``). With
+        ``answer`` the query is answered (and repeated taps debounced)
+        before the handler runs; otherwise the handler answers it itself.
+        """
+        if SEPARATOR in code or "_" in code:
+            raise ValueError(f"Invalid callback code {code!r}")
+        self._routes[code] = Route(code, handler, tuple(fields), answer)
+
+    def legacy(self, prefix, parser):
+        """Translate old data starting with ``prefix`` via ``parser(data) -> (code, args)`` or None"""
+        self._legacy[prefix] = parser
+
+    def routes(self):
+        """The registered routes (their ``handler`` may be wrapped, e.g. by benchmarks)"""
+        return list(self._routes.values())
+
+    def resolve(self, data):
+        """The (route, args) for callback data, or None if it is unknown or malformed"""
+        code, separator, rest = data.partition(SEPARATOR)
+        route = self._routes.get(code)
+        try:
+            if route is not None:
+                return route, route.decode(rest if separator else "")
+            parser = self._legacy.get(data.partition("_")[0])
+            translated = parser(data) if parser else None
+            if translated is None:
+                return None
+            code, args = translated
+            route = self._routes[code]
+            return route, route.decode(SEPARATOR.join(_escape(arg) for arg in args))
+        except (ValueError, KeyError):
+            return None
+
+    async def dispatch(self, update, context):
+        """Run the handler for ``update.callback_query``"""
+        query = update.callback_query
+        resolved = self.resolve(query.data or "")
+        if resolved is None:
+            # A button from an old or foreign message: just stop the spinner
+            await query.answer()
+            return
+        route, args = resolved
+        if route.answer:
+            await query.answer()
+            if self.debouncer and self.debouncer.interval and self.debouncer.is_duplicate(query):
+                CALLBACKS_DEBOUNCED.inc()
+                return
+        await route.handler(update, context, *args)
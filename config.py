@@ -1,5 +1,8 @@
 import os
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Config:
     # Telegram Bot Token
@@ -28,11 +31,127 @@ class Config:
     # Webhook Configuration
     WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
     PORT = int(os.getenv("PORT", 5000))
-    
+    # Secret Telegram sends with every webhook request; random per start if unset
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+
+    # Webhook worker processes sharing the port; with more than one, state
+    # is shared through SHARED_STATE_PATH and one leader reads Sheets.
+    # WORKER_ID is set by the supervisor for each worker it starts.
+    WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", 1)))
+    WORKER_ID = os.getenv("WORKER_ID", "")
+
+    # Update processing: handler concurrency (updates from one user always
+    # run in order) and how many updates may be queued or in progress
+    # before the webhook asks Telegram to retry
+    CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 32))
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+    UPDATE_QUEUE_TIMEOUT = float(os.getenv("UPDATE_QUEUE_TIMEOUT", 2))
+    # Repeats of the same button tap by one user within this many seconds
+    # are answered but not handled again (0 disables debouncing)
+    CALLBACK_DEBOUNCE = float(os.getenv("CALLBACK_DEBOUNCE", 1))
+
+    # Google Sheets worker pool (blocking gspread calls run off the event loop)
+    SHEETS_MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", 4))
+    SHEETS_CALL_TIMEOUT = float(os.getenv("SHEETS_CALL_TIMEOUT", 10))
+
+    # Google Sheets API quotas (requests per minute per user) and retries
+    SHEETS_READ_QUOTA = int(os.getenv("SHEETS_READ_QUOTA", 60))
+    SHEETS_WRITE_QUOTA = int(os.getenv("SHEETS_WRITE_QUOTA", 60))
+    SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", 4))
+    SHEETS_MAX_BACKOFF = float(os.getenv("SHEETS_MAX_BACKOFF", 30))
+
+    # Circuit breaker: consecutive failed calls before Sheets is skipped, and
+    # seconds before it is tried again. Reads slower than SHEETS_HEDGE_AFTER
+    # seconds get a second, parallel attempt (0 disables hedging).
+    SHEETS_BREAKER_FAILURES = int(os.getenv("SHEETS_BREAKER_FAILURES", 5))
+    SHEETS_BREAKER_RESET = float(os.getenv("SHEETS_BREAKER_RESET", 30))
+    SHEETS_HEDGE_AFTER = float(os.getenv("SHEETS_HEDGE_AFTER", 2))
+
+    # About/Payments cache (seconds)
+    SHEET_CACHE_TTL = float(os.getenv("SHEET_CACHE_TTL", 300))
+    SHEET_CACHE_REFRESH_INTERVAL = float(os.getenv("SHEET_CACHE_REFRESH_INTERVAL", 240))
+
+    # Local data directory (write journals, snapshots)
+    DATA_DIR = os.getenv("DATA_DIR", "data")
+
+    # Write-behind queue for Users sheet updates (seconds)
+    # Each worker keeps its own journals
+    _JOURNAL_SUFFIX = f".{WORKER_ID}" if WORKER_ID else ""
+    USER_WRITE_JOURNAL = os.path.join(DATA_DIR, f"user_writes{_JOURNAL_SUFFIX}.jsonl")
+    WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", 0.5))
+    WRITE_MAX_BACKOFF = float(os.getenv("WRITE_MAX_BACKOFF", 60))
+    PAYMENT_WRITE_JOURNAL = os.path.join(DATA_DIR, f"payment_writes{_JOURNAL_SUFFIX}.jsonl")
+
+    # Cross-worker shared state (seconds): how often workers look for
+    # invalidations, and how long the leader lease lasts without renewal
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", os.path.join(DATA_DIR, "shared.db"))
+    SHARED_POLL_INTERVAL = float(os.getenv("SHARED_POLL_INTERVAL", 0.5))
+    LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", 15))
+
+    # Last known Users/About/Payments content, served right after a restart
+    # until the live sheets have been read (empty disables snapshots)
+    SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(DATA_DIR, "snapshots"))
+
+    # Google Sheets connection retries in the background (seconds)
+    SHEETS_CONNECT_MAX_BACKOFF = float(os.getenv("SHEETS_CONNECT_MAX_BACKOFF", 300))
+
+    # Storage backend: "sheets" (Google Sheets only) or "sqlite" (local
+    # SQLite primary, mirrored to the Users and payment records sheets)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets").lower()
+    SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "bot.db"))
+    # Sheets-only mode keeps payments awaiting approval in a local ledger;
+    # approved/rejected ones are deleted after this many seconds
+    PAYMENTS_PATH = os.path.join(DATA_DIR, "payments.db")
+    PAYMENT_RETENTION = float(os.getenv("PAYMENT_RETENTION", 30 * 24 * 3600))
+
+    # Payment flow state (seconds): flush interval, idle time before a user
+    # is dropped from memory, and age after which an abandoned flow is deleted
+    FLOW_STATE_PATH = os.path.join(DATA_DIR, "flow_state.db")
+    FLOW_STATE_FLUSH_INTERVAL = float(os.getenv("FLOW_STATE_FLUSH_INTERVAL", 2))
+    FLOW_STATE_IDLE_TTL = float(os.getenv("FLOW_STATE_IDLE_TTL", 3600))
+    FLOW_STATE_MAX_AGE = float(os.getenv("FLOW_STATE_MAX_AGE", 7 * 24 * 3600))
+
+    # Telegram send limits (messages per second overall, seconds between
+    # messages to the same chat) and retries on flood control
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+    TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", 1))
+    TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 3))
+
+    # Broadcasts: at most this many messages a second, taken from the
+    # TELEGRAM_GLOBAL_RATE budget only when no reply is waiting, and users
+    # per checkpoint
+    BROADCAST_PATH = os.path.join(DATA_DIR, "broadcasts.db")
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 20))
+    BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", 50))
+
+    # Daily payment counters behind the admin /stats command
+    STATS_PATH = os.path.join(DATA_DIR, "stats.db")
+
+    # Duplicate screenshot detection: how different (in bits of a 64-bit
+    # perceptual hash, at most 7) a re-upload may be, threads computing the
+    # hashes (with Pillow), and seconds screenshots are remembered
+    SCREENSHOT_INDEX_PATH = os.path.join(DATA_DIR, "screenshots.db")
+    SCREENSHOT_MAX_DISTANCE = int(os.getenv("SCREENSHOT_MAX_DISTANCE", 4))
+    SCREENSHOT_HASH_WORKERS = int(os.getenv("SCREENSHOT_HASH_WORKERS", 2))
+    SCREENSHOT_INDEX_MAX_AGE = float(os.getenv("SCREENSHOT_INDEX_MAX_AGE", 180 * 24 * 3600))
+
+    # Pending payments per page of the admin /review list
+    REVIEW_PAGE_SIZE = int(os.getenv("REVIEW_PAGE_SIZE", 8))
+
+    # How many payment screenshots keep their per-admin delivery status
+    DELIVERY_HISTORY_SIZE = int(os.getenv("DELIVERY_HISTORY_SIZE", 200))
+
+    # Log the hottest stacks of updates slower than this (0 disables the profiler)
+    PROFILE_SLOW_UPDATES_MS = int(os.getenv("PROFILE_SLOW_UPDATES_MS", 0))
+
     # Database (for storing user levels - using Google Sheets as database)
     USERS_SHEET_NAME = "Users"
     PAYMENTS_SHEET_NAME = "Payments"
     ABOUT_SHEET_NAME = "About"
+    # Submitted/approved/rejected payments are logged here; the Payments
+    # sheet itself holds the plan price list shown to users
+    PAYMENT_RECORDS_SHEET_NAME = "PaymentRecords"
     
     @classmethod
     def validate_config(cls):
@@ -49,14 +168,7 @@ class Config:
             errors.append("SHEET_ID is required")
         
         if not cls.ADMIN_IDS:
-            print("Warning: No ADMIN_IDS configured")
+            logger.warning("No ADMIN_IDS configured")
         
         if errors:
             raise ValueError("Configuration errors: " + ", ".join(errors))
-
-# Validate configuration when module is imported
-try:
-    Config.validate_config()
-    print("✅ Configuration loaded successfully")
-except ValueError as e:
-    print(f"❌ {e}")
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class FlowStateStore:
+    """Durable per-user state for the payment flow.
+
+    State lives in a small SQLite table and is loaded into memory per user on
+    first access. Changed users are written back in one transaction every
+    few seconds, users idle past ``idle_ttl`` are dropped from memory, and
+    abandoned flows older than ``max_age`` are deleted from disk.
+
+    With ``shared`` (several worker processes on one database) nothing is
+    kept in memory: every read goes to SQLite and every change is written
+    at once, so a user's next update may land on any worker.
+    """
+
+    def __init__(self, path=None, idle_ttl=None, max_age=None, flush_interval=None, shared=False):
+        self.path = path or Config.FLOW_STATE_PATH
+        self.shared = shared
+        self.idle_ttl = idle_ttl or Config.FLOW_STATE_IDLE_TTL
+        self.max_age = max_age or Config.FLOW_STATE_MAX_AGE
+        self.flush_interval = flush_interval or Config.FLOW_STATE_FLUSH_INTERVAL
+        self._states = {}      # user_id -> dict
+        self._last_used = {}   # user_id -> monotonic time
+        self._dirty = set()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS flow_state (
+                    user_id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+        return self._db
+
+    def __len__(self):
+        return len(self._states)
+
+    def get(self, user_id):
+        """Return the user's state dict, loading it from disk on first access.
+
+        Treat the result as read-only; change it through ``update()``.
+        """
+        state = None if self.shared else self._states.get(user_id)
+        if state is None:
+            row = self._connect().execute(
+                "SELECT data FROM flow_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            state = json.loads(row[0]) if row else {}
+            if self.shared:
+                return state
+            self._states[user_id] = state
+        self._last_used[user_id] = time.monotonic()
+        return state
+
+    def update(self, user_id, **changes):
+        """Change some keys of the user's state; persisted on the next flush"""
+        state = self.get(user_id)
+        state.update(changes)
+        if self.shared:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO flow_state VALUES (?, ?, ?)", (user_id, json.dumps(state), time.time())
+            )
+            return
+        self._dirty.add(user_id)
+
+    def flush(self):
+        """Write changed users to disk and drop idle ones from memory"""
+        now = time.time()
+        if self._dirty:
+            rows = [(user_id, json.dumps(self._states[user_id]), now) for user_id in self._dirty]
+            db = self._connect()
+            with db:
+                db.execute("BEGIN")
+                db.executemany("INSERT OR REPLACE INTO flow_state VALUES (?, ?, ?)", rows)
+            self._dirty.clear()
+
+        cutoff = time.monotonic() - self.idle_ttl
+        for user_id in [u for u, used in self._last_used.items() if used < cutoff]:
+            del self._last_used[user_id]
+            del self._states[user_id]
+
+    def purge_expired(self):
+        """Delete flows nobody has touched for ``max_age`` seconds"""
+        self._connect().execute("DELETE FROM flow_state WHERE updated < ?", (time.time() - self.max_age,))
+
+    async def run(self):
+        """Flush on an interval until cancelled"""
+        last_purge = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if time.monotonic() - last_purge > 3600:
+                    self.purge_expired()
+                    last_purge = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error flushing flow state: {e}")
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
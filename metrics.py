@@ -0,0 +1,288 @@
+import bisect
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter as _Counter
+
+from telegram.request import BaseRequest
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_text(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge whose value is read from a callback at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._callbacks = {}
+
+    def set_function(self, func, *labelvalues):
+        self._callbacks[labelvalues] = func
+
+    def _samples(self):
+        samples = []
+        for labelvalues, func in sorted(self._callbacks.items()):
+            try:
+                value = func()
+            except Exception as e:
+                logger.error(f"Error reading gauge {self.name}: {e}")
+                continue
+            samples.append(f"{self.name}{_label_text(self.labelnames, labelvalues)} {value}")
+        return samples
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labelvalues -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        samples = []
+        for labelvalues, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = (("le", repr(float(bound))),)
+                samples.append(f"{self.name}_bucket{_label_text(self.labelnames, labelvalues, le)} {cumulative}")
+            inf = (("le", "+Inf"),)
+            samples.append(f"{self.name}_bucket{_label_text(self.labelnames, labelvalues, inf)} {state[-1]}")
+            samples.append(f"{self.name}_sum{_label_text(self.labelnames, labelvalues)} {state[-2]}")
+            samples.append(f"{self.name}_count{_label_text(self.labelnames, labelvalues)} {state[-1]}")
+        return samples
+
+
+REGISTRY = []
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_LATENCY = Histogram(
+    "meow_handler_latency_seconds", "Time spent in each update handler", ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "meow_handler_errors_total", "Exceptions raised by update handlers", ["handler"]
+)
+SHEETS_CALLS = Counter(
+    "meow_sheets_calls_total", "Google Sheets API calls", ["worksheet", "operation"]
+)
+SHEETS_ERRORS = Counter(
+    "meow_sheets_errors_total", "Failed Google Sheets API calls (including retried ones)", ["worksheet", "operation"]
+)
+SHEETS_LATENCY = Histogram(
+    "meow_sheets_latency_seconds", "Google Sheets call latency including retries", ["worksheet", "operation"]
+)
+TELEGRAM_LATENCY = Histogram(
+    "meow_telegram_api_latency_seconds", "Telegram Bot API call latency", ["method"]
+)
+TELEGRAM_ERRORS = Counter(
+    "meow_telegram_api_errors_total", "Telegram Bot API calls that did not return 200", ["method"]
+)
+SHEETS_BREAKER = Gauge(
+    "meow_sheets_breaker_state", "Sheets circuit breaker state (0 closed, 1 half-open, 2 open)"
+)
+SHEETS_REJECTED = Counter(
+    "meow_sheets_rejected_total", "Sheets calls refused because the circuit breaker was open"
+)
+SHEETS_COALESCED = Counter(
+    "meow_sheets_coalesced_total", "Sheets reads that joined an identical read already in flight", ["key"]
+)
+CALLBACKS_DEBOUNCED = Counter(
+    "meow_callbacks_debounced_total", "Repeated button taps that were answered but not handled again"
+)
+DUPLICATE_SCREENSHOTS = Counter(
+    "meow_duplicate_screenshots_total", "Payment screenshots seen before", ["kind", "action"]
+)
+UPDATE_QUEUE = Gauge(
+    "meow_update_queue", "Updates queued or being processed", ["state"]
+)
+
+
+def watch_application(application):
+    """Export the update queue and processor depth of ``application``"""
+    UPDATE_QUEUE.set_function(lambda: application.update_queue.pending, "pending")
+    processor = application.update_processor
+    if hasattr(processor, "stats"):
+        UPDATE_QUEUE.set_function(lambda: processor.stats()['waiting'], "waiting")
+        UPDATE_QUEUE.set_function(lambda: processor.stats()['active'], "active")
+
+
+class InstrumentedRequest(BaseRequest):
+    """Wraps another request object and times every Bot API call"""
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await self.request.do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.inc(api_method)
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - started, api_method)
+        if code != 200:
+            TELEGRAM_ERRORS.inc(api_method)
+        return code, payload
+
+
+class SlowUpdateProfiler:
+    """Sampling profiler for slow updates.
+
+    While updates are running, a daemon thread samples the event loop
+    thread's stack every ``interval`` seconds. When an update turns out to
+    be slower than ``threshold`` seconds, its most frequent stacks are
+    logged. Samples show whatever the loop was executing, so a slow update
+    whose samples are mostly idle was waiting on I/O, not our code.
+    """
+
+    def __init__(self, threshold, interval=0.005, top=5):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self._active = {}
+        self._lock = threading.Lock()
+        self._loop_thread = None
+        self._thread = None
+
+    def begin(self):
+        if self._thread is None:
+            self._loop_thread = threading.get_ident()
+            self._thread = threading.Thread(target=self._sample, name="slow-update-profiler", daemon=True)
+            self._thread.start()
+        samples = _Counter()
+        with self._lock:
+            self._active[id(samples)] = samples
+        return samples
+
+    def end(self, samples, name, elapsed):
+        with self._lock:
+            self._active.pop(id(samples), None)
+        if elapsed >= self.threshold and samples:
+            hottest = "\n".join(f"  {count:>4}  {stack}" for stack, count in samples.most_common(self.top))
+            logger.warning(f"Slow update in {name}: {elapsed * 1000:.0f}ms, top stacks:\n{hottest}")
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = []
+                while frame is not None and len(stack) < 12:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                key = " <- ".join(stack) or "(idle)"
+                for samples in self._active.values():
+                    samples[key] += 1
+
+
+slow_update_profiler = (
+    SlowUpdateProfiler(Config.PROFILE_SLOW_UPDATES_MS / 1000) if Config.PROFILE_SLOW_UPDATES_MS else None
+)
+
+
+def instrument_handler(callback):
+    """Record latency and errors of a handler callback"""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context, *args):
+        samples = slow_update_profiler.begin() if slow_update_profiler else None
+        started = time.perf_counter()
+        try:
+            return await callback(update, context, *args)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_LATENCY.observe(elapsed, name)
+            if samples is not None:
+                slow_update_profiler.end(samples, name, elapsed)
+
+    return wrapper
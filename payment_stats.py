@@ -0,0 +1,201 @@
+import logging
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from config import Config
+from storage import APPROVED, PENDING, REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Events counted per day, plan, payment method and level
+REQUESTED = "requested"
+SUBMITTED = "submitted"
+
+# Longer reports list weeks instead of days, so a year still fits in one
+# Telegram message (4096 characters)
+MAX_DAILY_LINES = 14
+
+
+def _day(timestamp):
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+class PaymentStats:
+    """Running payment counters for the admin /stats view.
+
+    Every screenshot request, submitted screenshot and approval/rejection
+    bumps one counter row for its day, plan, method and level, so a report
+    only sums the rows of the days it covers, however many users and
+    payments there are. Pending counts are kept the same way: +1 on the
+    submission's day when it arrives, -1 when it is handled. Workers share
+    the SQLite file, so their counts add up.
+
+    Counting starts with the first run; payments submitted before that
+    are not counted, and handling them does not touch the pending count.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.STATS_PATH
+        self._db = None
+        self._started = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS payment_stats (
+                    day TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    plan TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, event, plan, method, level)
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES ('started', ?)", (str(time.time()),))
+            self._started = float(self._db.execute("SELECT value FROM meta WHERE key = 'started'").fetchone()[0])
+        return self._db
+
+    def _bump(self, rows):
+        """Add to counters; rows are (timestamp, event, plan, method, level, amount)"""
+        try:
+            self._connect().executemany("""
+                INSERT INTO payment_stats VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (day, event, plan, method, level) DO UPDATE SET count = count + excluded.count
+            """, [(_day(ts), event, plan or "", method or "", level or "", amount)
+                  for ts, event, plan, method, level, amount in rows])
+        except sqlite3.Error as e:
+            # Statistics must never break the payment flow
+            logger.error(f"Error updating payment stats: {e}")
+
+    def record_request(self, plan, method):
+        """A user picked a plan and method and was asked for a screenshot"""
+        self._bump([(time.time(), REQUESTED, plan, method, None, 1)])
+
+    def record_submission(self, payment):
+        self._bump([
+            (payment['created'], SUBMITTED, payment['plan'], payment['method'], None, 1),
+            (payment['created'], PENDING, payment['plan'], payment['method'], None, 1),
+        ])
+
+    def record_resolution(self, payment):
+        """``payment`` was just approved or rejected"""
+        self.record_resolutions([payment])
+
+    def record_resolutions(self, payments):
+        rows = []
+        self._connect()
+        for payment in payments:
+            rows.append((payment['handled_at'] or time.time(), payment['status'], payment['plan'], payment['method'],
+                         payment['level'] if payment['status'] == APPROVED else None, 1))
+            if payment['created'] and payment['created'] >= self._started:
+                rows.append((payment['created'], PENDING, payment['plan'], payment['method'], None, -1))
+        self._bump(rows)
+
+    def summary(self, days):
+        """Counts for the last ``days`` days (today included), plus everything still pending"""
+        db = self._connect()
+        since = _day(time.time() - (days - 1) * 86400)
+        totals = defaultdict(int)
+        by_level = defaultdict(int)
+        by_plan = defaultdict(lambda: defaultdict(int))
+        by_method = defaultdict(lambda: defaultdict(int))
+        daily = defaultdict(lambda: defaultdict(int))
+        rows = db.execute("""
+            SELECT day, event, plan, method, level, count FROM payment_stats
+            WHERE day >= ? AND event != ?
+        """, (since, PENDING))
+        for day, event, plan, method, level, count in rows:
+            totals[event] += count
+            by_plan[plan or "N/A"][event] += count
+            by_method[method or "N/A"][event] += count
+            daily[day][event] += count
+            if event == APPROVED:
+                by_level[level or "N/A"] += count
+        # Pending is a state, not an event: count it whatever the window
+        for plan, method, count in db.execute("""
+            SELECT plan, method, SUM(count) FROM payment_stats WHERE event = ? GROUP BY plan, method
+        """, (PENDING,)):
+            totals[PENDING] += count
+            by_plan[plan or "N/A"][PENDING] += count
+            by_method[method or "N/A"][PENDING] += count
+        return {
+            'days': days,
+            'totals': totals,
+            'by_level': by_level,
+            'by_plan': by_plan,
+            'by_method': by_method,
+            'daily': daily,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _conversion(counts):
+    if not counts[REQUESTED]:
+        return "-"
+    return f"{100 * counts[APPROVED] / counts[REQUESTED]:.0f}%"
+
+
+def _breakdown(title, groups):
+    lines = [f"\n{title} (requested / sent / approved / rejected / pending):"]
+    for name, counts in sorted(groups.items(), key=lambda item: -item[1][APPROVED]):
+        if any(counts.values()):
+            lines.append(
+                f"  {name}: {counts[REQUESTED]} / {counts[SUBMITTED]} / {counts[APPROVED]} / "
+                f"{counts[REJECTED]} / {counts[PENDING]} ({_conversion(counts)})"
+            )
+    return lines
+
+
+def format_stats(summary):
+    """Text report of a ``PaymentStats.summary()`` for admins"""
+    totals = summary['totals']
+    lines = [
+        f"📊 Payments, last {summary['days']} day{'s' if summary['days'] != 1 else ''}",
+        f"Screenshot requests: {totals[REQUESTED]}",
+        f"Screenshots sent: {totals[SUBMITTED]}",
+        f"Approved: {totals[APPROVED]}",
+        f"Rejected: {totals[REJECTED]}",
+        f"Pending (all time): {totals[PENDING]}",
+        f"Conversion (approved / requested): {_conversion(totals)}",
+    ]
+    if summary['by_level']:
+        lines.append("\nApproved by level:")
+        lines.extend(
+            f"  {level}: {count}"
+            for level, count in sorted(summary['by_level'].items(), key=lambda item: -item[1])
+        )
+    lines.extend(_breakdown("By plan", summary['by_plan']))
+    lines.extend(_breakdown("By method", summary['by_method']))
+    if summary['daily']:
+        series, title = summary['daily'], "Per day"
+        if summary['days'] > MAX_DAILY_LINES:
+            series, title = _weekly(series), "Per week, from Monday"
+        lines.append(f"\n{title} (requested / approved):")
+        lines.extend(
+            f"  {start}: {counts[REQUESTED]} / {counts[APPROVED]}"
+            for start, counts in sorted(series.items(), reverse=True)
+        )
+    return "\n".join(lines)
+
+
+def _weekly(daily):
+    """Sum per-day counts into weeks keyed by their Monday"""
+    weeks = defaultdict(lambda: defaultdict(int))
+    for day, counts in daily.items():
+        day = date.fromisoformat(day)
+        monday = (day - timedelta(days=day.weekday())).isoformat()
+        for event, count in counts.items():
+            weeks[monday][event] += count
+    return weeks
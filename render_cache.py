@@ -0,0 +1,34 @@
+from telegram.error import BadRequest
+
+
+class RenderCache:
+    """Rendered menu text and markup, rebuilt only when the content version changes"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, key, version, build):
+        """Return ``build()`` for ``key``, reusing it while ``version`` is unchanged"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            entry = (version, build())
+            self._entries[key] = entry
+        return entry[1]
+
+
+async def edit_message(query, text, reply_markup=None):
+    """Edit the query's message unless it already shows exactly this content"""
+    # Telegram trims surrounding whitespace, so compare against what it stores
+    message = query.message
+    if message is not None and message.text == text.strip() and message.reply_markup == reply_markup:
+        return False
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+        return False
+    return True
@@ -0,0 +1,195 @@
+import asyncio
+import io
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is in requirements.txt; if it is missing anyway only exact
+    # resubmissions are found
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+EXACT = "exact"
+SIMILAR = "similar"
+
+# A 64-bit hash split into 8 bands of 8 bits: two hashes at most 7 bits
+# apart share at least one band, so only rows sharing a band are compared
+HASH_BANDS = 8
+BAND_BITS = 64 // HASH_BANDS
+
+
+def difference_hash(data):
+    """64-bit dHash of an image: brighter/darker for adjacent pixels of a 9x8 thumbnail"""
+    image = Image.open(io.BytesIO(data)).convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(band << BAND_BITS) | ((value >> (band * BAND_BITS)) & mask) for band in range(HASH_BANDS)]
+
+
+class ScreenshotIndex:
+    """Payment screenshots seen before, for flagging resubmissions.
+
+    Exact copies (a resent or forwarded photo) share Telegram's
+    ``file_unique_id``. Re-uploads of the same image get a new ID but an
+    almost identical perceptual hash, computed from the smallest photo
+    size on a small thread pool and matched through a band index. Rows
+    older than ``max_age`` seconds are forgotten.
+    """
+
+    def __init__(self, path=None, max_distance=None, workers=None, max_age=None):
+        self.path = path or Config.SCREENSHOT_INDEX_PATH
+        self.max_distance = min(max_distance if max_distance is not None else Config.SCREENSHOT_MAX_DISTANCE,
+                                HASH_BANDS - 1)
+        self.max_age = max_age or Config.SCREENSHOT_INDEX_MAX_AGE
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or Config.SCREENSHOT_HASH_WORKERS, thread_name_prefix="screenshot-hash"
+        ) if Image is not None else None
+        if Image is None:
+            logger.warning("Pillow is not installed, re-uploaded screenshots will not be detected")
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS screenshots (
+                    payment_id TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    file_unique_id TEXT,
+                    phash TEXT,
+                    match_payment_id TEXT,
+                    match_kind TEXT,
+                    match_distance INTEGER,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS screenshots_file ON screenshots (file_unique_id);
+                CREATE TABLE IF NOT EXISTS screenshot_bands (
+                    band INTEGER NOT NULL,
+                    payment_id TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS screenshot_bands_band ON screenshot_bands (band);
+            """)
+            cutoff = time.time() - self.max_age
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute("""
+                    DELETE FROM screenshot_bands WHERE payment_id IN (
+                        SELECT payment_id FROM screenshots WHERE created < ?
+                    )
+                """, (cutoff,))
+                self._db.execute("DELETE FROM screenshots WHERE created < ?", (cutoff,))
+        return self._db
+
+    def find_exact(self, file_unique_id):
+        """The latest earlier screenshot with this ``file_unique_id``, as a match dict"""
+        row = self._connect().execute(
+            "SELECT payment_id, user_id FROM screenshots WHERE file_unique_id = ? ORDER BY created DESC LIMIT 1",
+            (file_unique_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'payment_id': row['payment_id'], 'user_id': row['user_id'], 'kind': EXACT, 'distance': 0}
+
+    def add(self, payment, match=None):
+        """Remember ``payment``'s screenshot and what it was found to duplicate"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO screenshots VALUES (?, ?, ?, NULL, ?, ?, ?, ?)",
+            (payment['payment_id'], payment['user_id'], payment['file_unique_id'],
+             *self._match_columns(match), payment['created'])
+        )
+
+    @staticmethod
+    def _match_columns(match):
+        if match is None:
+            return None, None, None
+        return match['payment_id'], match['kind'], match['distance']
+
+    async def perceptual_hash(self, bot, photo):
+        """Hash of a ``PhotoSize``, or None without Pillow or if it cannot be fetched"""
+        if self._executor is None:
+            return None
+        try:
+            telegram_file = await bot.get_file(photo.file_id)
+            data = await telegram_file.download_as_bytearray()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, difference_hash, bytes(data))
+        except Exception as e:
+            logger.warning(f"Could not hash screenshot {photo.file_unique_id}: {e}")
+            return None
+
+    def find_similar(self, payment_id, phash):
+        """The closest earlier screenshot within ``max_distance`` bits of ``phash``"""
+        rows = self._connect().execute(f"""
+            SELECT DISTINCT s.payment_id, s.user_id, s.phash FROM screenshot_bands b
+            JOIN screenshots s ON s.payment_id = b.payment_id
+            WHERE b.band IN ({",".join("?" * HASH_BANDS)}) AND s.payment_id != ?
+        """, (*_bands(phash), payment_id)).fetchall()
+        best = None
+        for row in rows:
+            distance = bin(int(row['phash'], 16) ^ phash).count("1")
+            if distance <= self.max_distance and (best is None or distance < best['distance']):
+                best = {'payment_id': row['payment_id'], 'user_id': row['user_id'],
+                        'kind': SIMILAR, 'distance': distance}
+        return best
+
+    def set_hash(self, payment_id, phash, match=None):
+        """Store the perceptual hash of an added screenshot (and a match found through it)"""
+        db = self._connect()
+        with db:
+            db.execute("BEGIN")
+            db.execute("UPDATE screenshots SET phash = ? WHERE payment_id = ?", (f"{phash:016x}", payment_id))
+            if match is not None:
+                db.execute(
+                    "UPDATE screenshots SET match_payment_id = ?, match_kind = ?, match_distance = ? "
+                    "WHERE payment_id = ?", (*self._match_columns(match), payment_id)
+                )
+            db.executemany(
+                "INSERT INTO screenshot_bands VALUES (?, ?)", [(band, payment_id) for band in _bands(phash)]
+            )
+
+    def match(self, payment_id):
+        """What ``payment_id``'s screenshot duplicates, or None"""
+        row = self._connect().execute(
+            "SELECT match_payment_id, match_kind, match_distance FROM screenshots WHERE payment_id = ?",
+            (payment_id,)
+        ).fetchone()
+        if row is None or row['match_payment_id'] is None:
+            return None
+        return {'payment_id': row['match_payment_id'], 'kind': row['match_kind'], 'distance': row['match_distance']}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def format_match(match, original):
+    """Caption line warning admins about a duplicate screenshot"""
+    if match['kind'] == EXACT:
+        line = f"⚠️ Same screenshot as payment {match['payment_id']}"
+    else:
+        line = f"⚠️ Looks like the screenshot of payment {match['payment_id']} ({match['distance']} bits apart)"
+    if original is not None:
+        line += f" from user {original['user_id']}, {original['status']}"
+    return line
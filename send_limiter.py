@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Send priorities: replies to users first, campaign messages (broadcasts)
+# only with what is left of the global rate
+USER = "user"
+BACKGROUND = "background"
+
+
+class SendLimiter:
+    """Pace outgoing Telegram sends under the global and per-chat limits.
+
+    Each send reserves the next free slot on its chat's schedule (one
+    message every ``per_chat_interval`` seconds) and then on the global
+    schedule (``global_rate`` messages a second), so concurrent senders
+    spread out instead of all hitting Telegram at once.
+
+    ``BACKGROUND`` sends share the same global schedule but take a slot
+    only when no ``USER`` send is waiting for one, and at most
+    ``background_rate`` a second.
+    """
+
+    def __init__(self, global_rate=None, per_chat_interval=None, max_retries=None, background_rate=None):
+        # The bot-wide rate is split between the worker processes
+        self.global_interval = 1.0 / (global_rate or Config.TELEGRAM_GLOBAL_RATE / Config.WEB_WORKERS)
+        self.background_interval = 1.0 / (background_rate or Config.BROADCAST_RATE)
+        self.per_chat_interval = per_chat_interval or Config.TELEGRAM_PER_CHAT_INTERVAL
+        self.max_retries = max_retries if max_retries is not None else Config.TELEGRAM_MAX_RETRIES
+        self._next_global = 0.0
+        self._next_chat = {}
+        self._next_background = 0.0
+        # Created on first use so it binds to the running event loop
+        self._background_lock = None
+
+    async def _wait_turn(self, chat_id, priority=USER):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # Wait for this chat's slot first so a busy chat does not hold up
+        # the global schedule for everyone else
+        chat_slot = max(now, self._next_chat.get(chat_id, 0.0))
+        self._next_chat[chat_id] = chat_slot + self.per_chat_interval
+        if len(self._next_chat) > 10000:
+            # Drop chats whose slot is already in the past
+            self._next_chat = {k: v for k, v in self._next_chat.items() if v > now}
+        if chat_slot > now:
+            await asyncio.sleep(chat_slot - now)
+
+        if priority == BACKGROUND:
+            if self._background_lock is None:
+                self._background_lock = asyncio.Lock()
+            # One background sender at a time waits for the schedule to be
+            # free, so user sends that arrive meanwhile still go first
+            async with self._background_lock:
+                while True:
+                    now = loop.time()
+                    start = max(self._next_global, self._next_background)
+                    if start <= now:
+                        break
+                    await asyncio.sleep(start - now)
+                self._next_background = now + self.background_interval
+
+        now = loop.time()
+        slot = max(now, self._next_global)
+        self._next_global = slot + self.global_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def send(self, chat_id, send_func, priority=USER):
+        """Await ``send_func()`` in this chat's turn, retrying on flood control"""
+        attempt = 0
+        while True:
+            await self._wait_turn(chat_id, priority)
+            try:
+                return await send_func()
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                # Telegram told us exactly how long to back off; everyone waits
+                delay = float(e.retry_after)
+                self._next_global = max(self._next_global, asyncio.get_running_loop().time() + delay)
+            except (TimedOut, NetworkError) as e:
+                # BadRequest is a NetworkError too, but retrying it is pointless
+                if isinstance(e, BadRequest) or attempt >= self.max_retries:
+                    raise
+                delay = 2 ** attempt
+            attempt += 1
+            logger.warning(f"Send to {chat_id} throttled, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
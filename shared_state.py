@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from collections import defaultdict
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState:
+    """State shared by all worker processes through one SQLite (WAL) file.
+
+    - a key/value table for data every worker serves (sheet contents,
+      admin deliveries), written by one worker and read by all
+    - an append-only events table used as an invalidation channel: writers
+      publish a topic, every other worker polls for new events and calls
+      its subscribers
+    - a leader lease, so work that must happen once (Sheets reads,
+      resuming broadcasts) is done by a single worker; if the leader dies
+      another takes over when the lease expires
+    """
+
+    def __init__(self, path=None, poll_interval=None, lease_ttl=None):
+        self.path = path or Config.SHARED_STATE_PATH
+        self.poll_interval = poll_interval or Config.SHARED_POLL_INTERVAL
+        self.lease_ttl = lease_ttl or Config.LEADER_LEASE_TTL
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._subscribers = defaultdict(list)
+        self._last_event = None
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    origin TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires REAL NOT NULL
+                );
+            """)
+            # Only events published from now on are interesting
+            self._last_event = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        return self._db
+
+    def get(self, key):
+        row = self._connect().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, publish=True):
+        """Store ``value`` under ``key``; other workers are told unless ``publish`` is False"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, json.dumps(value), time.time())
+        )
+        if publish:
+            self.publish(key)
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def items(self, prefix, limit=None):
+        """(key, value) pairs under ``prefix``, oldest first, at most the newest ``limit``"""
+        rows = self._connect().execute(
+            "SELECT key, value FROM kv WHERE key >= ? AND key < ? ORDER BY updated DESC LIMIT ?",
+            (prefix, prefix + "\uffff", -1 if limit is None else limit)
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in reversed(rows)]
+
+    def trim(self, prefix, keep):
+        """Delete all but the ``keep`` most recently updated keys under ``prefix``"""
+        self._connect().execute("""
+            DELETE FROM kv WHERE key >= ? AND key < ? AND key NOT IN (
+                SELECT key FROM kv WHERE key >= ? AND key < ? ORDER BY updated DESC LIMIT ?
+            )
+        """, (prefix, prefix + "\uffff", prefix, prefix + "\uffff", keep))
+
+    def publish(self, topic):
+        self._connect().execute(
+            "INSERT INTO events (topic, origin, created) VALUES (?, ?, ?)", (topic, self.owner, time.time())
+        )
+
+    def subscribe(self, prefix, callback):
+        """Call ``callback(topic)`` when another worker publishes a topic starting with ``prefix``"""
+        self._subscribers[prefix].append(callback)
+
+    def poll(self):
+        """Deliver events published by other workers since the last poll"""
+        db = self._connect()
+        rows = db.execute(
+            "SELECT id, topic, origin FROM events WHERE id > ? ORDER BY id", (self._last_event,)
+        ).fetchall()
+        for event_id, topic, origin in rows:
+            self._last_event = event_id
+            if origin == self.owner:
+                continue
+            for prefix, callbacks in self._subscribers.items():
+                if topic.startswith(prefix):
+                    for callback in callbacks:
+                        try:
+                            callback(topic)
+                        except Exception as e:
+                            logger.error(f"Error handling shared event {topic}: {e}")
+
+    def renew_lease(self, name="leader"):
+        """Take or extend the lease if it is free, expired or already ours"""
+        db = self._connect()
+        now = time.time()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            held = row is not None and row[0] != self.owner and row[1] > now
+            if not held:
+                db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (name, self.owner, now + self.lease_ttl))
+        if self.is_leader != (not held):
+            logger.info(f"{'Became' if not held else 'No longer'} the {name} ({self.owner})")
+        self.is_leader = not held
+        return self.is_leader
+
+    def release_lease(self, name="leader"):
+        self._connect().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+        self.is_leader = False
+
+    async def run(self):
+        """Poll for events and keep the lease fresh until cancelled"""
+        last_renewal = 0.0
+        while True:
+            try:
+                self.poll()
+                if time.monotonic() - last_renewal > self.lease_ttl / 3:
+                    self.renew_lease()
+                    last_renewal = time.monotonic()
+                    if self.is_leader:
+                        # Everyone has long since seen these
+                        self._db.execute("DELETE FROM events WHERE created < ?", (time.time() - 3600,))
+            except sqlite3.Error as e:
+                logger.error(f"Error syncing shared state: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def close(self):
+        if self._db is not None:
+            if self.is_leader:
+                self.release_lease()
+            self._db.close()
+            self._db = None
+
+
+def create_shared_state():
+    """SharedState when several workers serve the webhook, else None"""
+    return SharedState() if Config.WEB_WORKERS > 1 else None
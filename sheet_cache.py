@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+from config import Config
+from sheets_client import BACKGROUND, USER
+from snapshot import load_snapshot, save_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a failed refresh of a cache that still has data is retried
+RETRY_AFTER_ERROR = 30
+
+
+class SheetCache:
+    """Read-through TTL cache for worksheet content.
+
+    Reads are served from memory. Once the TTL has passed the stale value is
+    still returned while a single background refresh runs; only the very
+    first read has to wait for Sheets, unless ``warm_load()`` found a
+    snapshot from the previous run.
+    """
+
+    def __init__(self, name, loader, ttl=None):
+        self.name = name
+        self.loader = loader  # async callable(priority=...) returning the fresh rows
+        self.ttl = ttl or Config.SHEET_CACHE_TTL
+        self.value = None
+        self.loaded_at = 0.0
+        # Bumped every time the content actually changes
+        self.version = 0
+        self._refresh_task = None
+
+    @property
+    def is_stale(self):
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    async def warm_load(self):
+        """Serve the last saved content until the first live read replaces it"""
+        rows = await asyncio.get_running_loop().run_in_executor(None, load_snapshot, self.name)
+        if rows is not None and self.value is None:
+            self.value = rows
+            self.version += 1
+            # loaded_at stays 0, so the first get() starts a refresh
+            logger.info(f"Warm-loaded {self.name} from snapshot")
+
+    def invalidate(self):
+        """Treat the content as stale, so the next read refreshes it"""
+        self.loaded_at = 0.0
+
+    async def get(self):
+        """Return the cached rows, or None if they could never be loaded"""
+        if self.value is None:
+            # Someone is waiting on this one, so it goes at user priority
+            await self.refresh(priority=USER)
+        elif self.is_stale:
+            self._start_refresh()
+        return self.value
+
+    async def refresh(self, priority=BACKGROUND):
+        """Reload now; concurrent callers share the same in-flight refresh"""
+        await asyncio.shield(self._start_refresh(priority))
+        return self.value
+
+    def _start_refresh(self, priority=BACKGROUND):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._load(priority))
+        return self._refresh_task
+
+    async def _load(self, priority):
+        try:
+            rows = await self.loader(priority=priority)
+        except Exception as e:
+            # Keep serving whatever we had before
+            logger.error(f"Error refreshing {self.name} cache: {e}")
+            if self.value is not None:
+                # Retry in a little while rather than on every read
+                self.loaded_at = time.monotonic() - self.ttl + min(self.ttl, RETRY_AFTER_ERROR)
+            return
+        if rows != self.value:
+            self.value = rows
+            self.version += 1
+            await asyncio.get_running_loop().run_in_executor(None, save_snapshot, self.name, rows)
+        self.loaded_at = time.monotonic()
+
+
+async def run_cache_refresher(caches, interval=None):
+    """Refresh every cache on a fixed interval until cancelled"""
+    interval = interval or Config.SHEET_CACHE_REFRESH_INTERVAL
+    while True:
+        await asyncio.gather(*(cache.refresh() for cache in caches))
+        await asyncio.sleep(interval)
@@ -0,0 +1,195 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+
+import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from metrics import SHEETS_CALLS, SHEETS_ERRORS, SHEETS_LATENCY
+
+logger = logging.getLogger(__name__)
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# Request priorities: user-facing reads may use the whole quota, background
+# jobs leave a reserve so a menu tap never waits behind a refresh
+USER = "user"
+BACKGROUND = "background"
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# time.monotonic() by which the caller stops waiting for the current call
+# (set by sheets_gateway); quota waits and retries never run past it
+call_deadline = contextvars.ContextVar("sheets_call_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call could not be made before its caller's deadline"""
+
+
+def is_transient_error(error):
+    """Quota, server and connection errors; worth retrying later"""
+    if isinstance(error, gspread.exceptions.APIError):
+        return getattr(error.response, "status_code", None) in RETRY_STATUS_CODES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``per_minute`` tokens a minute"""
+
+    def __init__(self, per_minute, reserve=0.2):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.reserve = self.capacity * reserve
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority=USER, deadline=None):
+        """Block until a token is available for this priority.
+
+        Raises DeadlineExceeded if none will be before ``deadline``.
+        """
+        floor = 1 if priority == USER else 1 + self.reserve
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= floor:
+                    self.tokens -= 1
+                    return
+                wait = (floor - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise DeadlineExceeded(f"No Sheets quota within the deadline ({wait:.1f}s to wait)")
+            time.sleep(wait)
+
+
+class SheetsClient:
+    """Quota-aware access to the bot's spreadsheet.
+
+    Holds one authorized, pooled HTTP session (google-auth refreshes the
+    token on it as needed), caches worksheet handles so they are fetched
+    once, rate-limits reads and writes against the Sheets per-minute
+    quotas and retries quota and 5xx errors with jittered backoff. Every
+    attempt, retries included, takes a token, and nothing is attempted
+    after the caller's ``call_deadline``.
+    """
+
+    def __init__(self, spreadsheet):
+        # A gspread Spreadsheet (or anything with the same surface)
+        self.spreadsheet = spreadsheet
+        # Quotas are per service account: only the leader worker reads,
+        # but every worker flushes its own writes, so they split that one
+        self.read_bucket = TokenBucket(Config.SHEETS_READ_QUOTA)
+        self.write_bucket = TokenBucket(Config.SHEETS_WRITE_QUOTA / Config.WEB_WORKERS)
+        self._worksheets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, credentials_info, sheet_id):
+        """Authorize with a service account and open the spreadsheet"""
+        credentials = Credentials.from_service_account_info(credentials_info, scopes=SCOPES)
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.SHEETS_MAX_WORKERS)
+        session.mount("https://", adapter)
+
+        client = gspread.Client(auth=credentials, session=session)
+        client.set_timeout(Config.SHEETS_CALL_TIMEOUT)
+        sheets = cls(None)
+        sheets.spreadsheet = sheets._with_retry(
+            ("", "open"), sheets.read_bucket, USER, client.open_by_key, sheet_id
+        )
+        return sheets
+
+    def worksheet(self, name):
+        """Return a cached worksheet handle, fetching all handles once"""
+        handle = self._worksheets.get(name)
+        if handle is None:
+            with self._lock:
+                if name not in self._worksheets:
+                    worksheets = self._with_retry(
+                        ("", "worksheets"), self.read_bucket, USER, self.spreadsheet.worksheets
+                    )
+                    for ws in worksheets:
+                        self._worksheets[ws.title] = ws
+                handle = self._worksheets.get(name)
+            if handle is None:
+                raise gspread.exceptions.WorksheetNotFound(name)
+        return handle
+
+    def ensure_worksheet(self, name, header):
+        """Return the worksheet ``name``, creating it with a ``header`` row if it is missing"""
+        try:
+            return self.worksheet(name)
+        except gspread.exceptions.WorksheetNotFound:
+            pass
+        with self._lock:
+            if name not in self._worksheets:
+                self._worksheets[name] = self._with_retry(
+                    ("", "add_worksheet"), self.write_bucket, BACKGROUND,
+                    self.spreadsheet.add_worksheet, name, 1000, len(header)
+                )
+                logger.info(f"Created the {name} worksheet")
+                self._with_retry(
+                    (name, "append_rows"), self.write_bucket, BACKGROUND, self._worksheets[name].append_rows, [header]
+                )
+            return self._worksheets[name]
+
+    def _with_retry(self, labels, bucket, priority, func, *args, **kwargs):
+        """Call ``func`` with retries; ``labels`` is (worksheet, operation) for metrics"""
+        attempt = 0
+        started = time.perf_counter()
+        deadline = call_deadline.get()
+        try:
+            while True:
+                bucket.acquire(priority, deadline)
+                SHEETS_CALLS.inc(*labels)
+                try:
+                    return func(*args, **kwargs)
+                except (gspread.exceptions.APIError, requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout) as e:
+                    SHEETS_ERRORS.inc(*labels)
+                    status = getattr(getattr(e, "response", None), "status_code", None)
+                    attempt += 1
+                    if not is_transient_error(e) or attempt > Config.SHEETS_MAX_RETRIES:
+                        raise
+                    # Full jitter keeps several workers from retrying in lockstep
+                    delay = random.uniform(0, min(Config.SHEETS_MAX_BACKOFF, 2 ** attempt))
+                    if deadline is not None and time.monotonic() + delay >= deadline:
+                        # The caller has given up by then; free the worker
+                        raise
+                    logger.warning(f"Sheets call failed ({status or e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+        finally:
+            SHEETS_LATENCY.observe(time.perf_counter() - started, *labels)
+
+    def _read(self, name, operation, priority, func, *args, **kwargs):
+        return self._with_retry((name, operation), self.read_bucket, priority, func, *args, **kwargs)
+
+    def _write(self, name, operation, priority, func, *args, **kwargs):
+        return self._with_retry((name, operation), self.write_bucket, priority, func, *args, **kwargs)
+
+    def get_all_values(self, name, priority=USER):
+        return self._read(name, "get_all_values", priority, self.worksheet(name).get_all_values)
+
+    def get_values(self, name, range_name, priority=USER):
+        return self._read(name, "get_values", priority, self.worksheet(name).get_values, range_name)
+
+    def batch_update(self, name, data, priority=BACKGROUND):
+        return self._write(name, "batch_update", priority, self.worksheet(name).batch_update, data)
+
+    def append_rows(self, name, rows, priority=BACKGROUND):
+        return self._write(name, "append_rows", priority, self.worksheet(name).append_rows, rows)
@@ -0,0 +1,209 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import Config
+from metrics import SHEETS_BREAKER, SHEETS_COALESCED, SHEETS_REJECTED
+from sheets_client import DeadlineExceeded, call_deadline, is_transient_error
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class SheetsUnavailableError(Exception):
+    """Raised instead of calling Sheets while it is known to be failing"""
+
+
+class SheetsTimeoutError(SheetsUnavailableError):
+    """Raised when a Sheets call does not finish in time"""
+
+
+class CircuitBreaker:
+    """Stops calling Sheets after repeated failures.
+
+    After ``failure_threshold`` consecutive timeouts or transient errors the
+    breaker opens and calls fail immediately. After ``reset_timeout``
+    seconds one trial call is let through (half-open); its success closes
+    the breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or Config.SHEETS_BREAKER_FAILURES
+        self.reset_timeout = reset_timeout or Config.SHEETS_BREAKER_RESET
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+
+    def before_call(self):
+        """Raise SheetsUnavailableError unless a call may go through now"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise SheetsUnavailableError("Google Sheets circuit breaker is open")
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trial_running:
+                raise SheetsUnavailableError("Google Sheets circuit breaker is half-open")
+            self._trial_running = True
+
+    def record_success(self):
+        self._trial_running = False
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_abandoned(self):
+        """The call was cancelled before it had an outcome; let another one be the trial"""
+        self._trial_running = False
+
+    def record_failure(self, error):
+        self._trial_running = False
+        if not isinstance(error, SheetsTimeoutError) and not is_transient_error(error):
+            # The call reached Sheets and got a real answer (bad range, ...)
+            self.record_success()
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != OPEN:
+                self._set_state(OPEN, error)
+
+    def _set_state(self, state, error=None):
+        reason = f" after {self.failures} failures ({error})" if error else ""
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Sheets circuit breaker {self.state} -> {state}{reason}")
+        self.state = state
+
+
+class SheetsGateway:
+    """Run blocking gspread calls on a bounded worker pool.
+
+    Handlers await ``run()`` instead of calling gspread directly, so a slow
+    Sheets round trip only holds one worker thread and never the event loop.
+    Every call passes through a circuit breaker, so while Sheets is failing
+    callers get ``SheetsUnavailableError`` at once and fall back to
+    snapshots and write queues instead of waiting. Identical reads that
+    overlap share a single request.
+    """
+
+    def __init__(self, max_workers=None, timeout=None, hedge_after=None):
+        self.max_workers = max_workers or Config.SHEETS_MAX_WORKERS
+        self.timeout = timeout or Config.SHEETS_CALL_TIMEOUT
+        self.hedge_after = hedge_after if hedge_after is not None else Config.SHEETS_HEDGE_AFTER
+        self.breaker = CircuitBreaker()
+        self._flights = SingleFlight()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="sheets"
+        )
+        # Created on first use so it binds to the running event loop
+        self._slots = None
+        SHEETS_BREAKER.set_function(lambda: (CLOSED, HALF_OPEN, OPEN).index(self.breaker.state))
+
+    async def run(self, func, *args, timeout=None, hedge=False, key=None, **kwargs):
+        """Run ``func(*args, **kwargs)`` on a worker thread and await the result.
+
+        With ``hedge`` (idempotent reads only) a second identical call is
+        started if the first has not answered within ``hedge_after``
+        seconds, and whichever finishes first wins.
+
+        Reads given a ``key`` (e.g. the worksheet and range) are coalesced:
+        callers arriving while a read with the same key is in flight wait
+        for it instead of starting their own, so a spike costs one request
+        per key. The shared result must not be modified.
+        """
+        if key is not None:
+            if key in self._flights:
+                SHEETS_COALESCED.inc(key)
+            return await self._flights.do(
+                key, partial(self.run, func, *args, timeout=timeout, hedge=hedge, **kwargs)
+            )
+        try:
+            self.breaker.before_call()
+        except SheetsUnavailableError:
+            SHEETS_REJECTED.inc()
+            raise
+        try:
+            result = await self._run(func, args, kwargs, timeout or self.timeout, hedge)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            raise
+        except BaseException:
+            # Cancelled (e.g. at shutdown): a half-open breaker must not
+            # wait forever for a trial that will never report back
+            self.breaker.record_abandoned()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _run(self, func, args, kwargs, timeout, hedge):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        name = getattr(func, "__name__", "sheets call")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        # A slot is held until the worker thread really finishes, so calls
+        # that timed out still count against the pool and nothing piles up
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise SheetsTimeoutError(f"No Sheets worker free for {name} within {timeout}s") from None
+        pending = {self._submit(loop, func, args, kwargs, deadline)}
+
+        if hedge and self.hedge_after and self.hedge_after < timeout:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            if not done and not self._slots.locked():
+                # Only hedge with a spare worker, never by queueing
+                await self._slots.acquire()
+                pending.add(self._submit(loop, func, args, kwargs, deadline))
+                logger.info(f"Sheets call {name} slower than {self.hedge_after}s, hedging")
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(deadline - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        if isinstance(error, DeadlineExceeded):
+            raise SheetsTimeoutError(f"{name}: {error}") from error
+        if error is not None:
+            raise error
+        logger.warning(f"Sheets call {name} timed out after {timeout}s")
+        raise SheetsTimeoutError(f"{name} timed out after {timeout}s")
+
+    def _submit(self, loop, func, args, kwargs, deadline):
+        # The worker thread stops retrying once this caller has given up
+        context = contextvars.copy_context()
+        context.run(call_deadline.set, time.monotonic() + deadline - loop.time())
+        future = loop.run_in_executor(self._executor, partial(context.run, func, *args, **kwargs))
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        self._slots.release()
+        # Retrieve the exception of abandoned calls so asyncio does not warn
+        if not future.cancelled():
+            future.exception()
+
+    def shutdown(self):
+        """Stop accepting new calls and let running ones finish in the background"""
+        self._executor.shutdown(wait=False)
+
+
+# Shared gateway used by all handlers
+sheets_gateway = SheetsGateway()
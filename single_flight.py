@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one.
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it runs await that same task and get the same result or error.
+    Nothing is cached: once the task has finished, the next call starts a
+    new one.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    def __contains__(self, key):
+        return key in self._flights
+
+    async def do(self, key, func):
+        """Return ``await func()``, sharing a call already in flight for ``key``"""
+        task = self._flights.get(key)
+        if task is None:
+            task = self._flights[key] = asyncio.create_task(func())
+            task.add_done_callback(lambda t: self._done(key, t))
+        # One caller giving up must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Retrieve the error even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+class CallbackDebouncer:
+    """Spots repeated taps on the same button.
+
+    A callback query is a duplicate when the same user sent the same data
+    from the same message, in the same edit of it, less than ``interval``
+    seconds ago. Updates from one user already run one at a time, so a
+    burst of taps would otherwise redo identical work back to back; coming
+    back to the same menu through other buttons edits the message, so
+    that is never mistaken for a repeat.
+    """
+
+    def __init__(self, interval, max_entries=10000):
+        self.interval = interval
+        self.max_entries = max_entries
+        self._seen = {}
+
+    def is_duplicate(self, query):
+        message = query.message
+        key = (
+            query.from_user.id,
+            message.message_id if message else None,
+            getattr(message, "edit_date", None),
+            query.data
+        )
+        now = time.monotonic()
+        last = self._seen.get(key)
+        if last is not None and now - last < self.interval:
+            return True
+        if len(self._seen) >= self.max_entries:
+            self._seen = {k: t for k, t in self._seen.items() if now - t < self.interval}
+        self._seen[key] = now
+        return False
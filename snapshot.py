@@ -0,0 +1,40 @@
+import json
+import logging
+import os
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _snapshot_path(name):
+    return os.path.join(Config.SNAPSHOT_DIR, f"{name}.json")
+
+
+def load_snapshot(name):
+    """Rows saved by the last successful read of ``name``, or None"""
+    if not Config.SNAPSHOT_DIR:
+        return None
+    try:
+        with open(_snapshot_path(name), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable {name} snapshot: {e}")
+        return None
+
+
+def save_snapshot(name, rows):
+    """Atomically replace the snapshot of ``name``; blocking, run it off the loop"""
+    if not Config.SNAPSHOT_DIR:
+        return
+    path = _snapshot_path(name)
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(Config.SNAPSHOT_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save {name} snapshot: {e}")
@@ -0,0 +1,620 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+from sheets_client import BACKGROUND, USER
+from sheets_gateway import sheets_gateway
+from snapshot import load_snapshot, save_snapshot
+from user_index import USERS_RANGE, UserIndex, UserRecord, row_from_updated_range
+from write_queue import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+# Payment statuses
+PENDING = "pending"
+APPROVED = "approved"
+REJECTED = "rejected"
+
+# Columns of the payment records sheet, created with this header if missing
+PAYMENT_RECORD_HEADER = [
+    "Payment ID", "User ID", "Username", "Name", "Plan", "Method", "Status", "Level", "Admin", "Time"
+]
+
+PAYMENT_FIELDS = (
+    "payment_id", "user_id", "username", "name", "plan", "method",
+    "status", "level", "created", "handled_by", "handled_at", "file_unique_id"
+)
+
+
+class SheetsMirror:
+    """Replicates user and payment changes to the spreadsheet in the background.
+
+    Level changes are coalesced per user into the Users sheet; payment
+    status changes are appended as one row each to the payment records sheet.
+    Both go through durable write-behind queues.
+    """
+
+    def __init__(self, storage, get_sheets):
+        self.storage = storage
+        self.get_sheets = get_sheets
+        self.users_queue = WriteBehindQueue("Users", Config.USER_WRITE_JOURNAL, self._flush_users)
+        self.payments_queue = WriteBehindQueue(
+            "payment record", Config.PAYMENT_WRITE_JOURNAL, self._flush_payments
+        )
+        # Set while an append to the Users sheet may have landed without
+        # us learning its rows (failed or timed-out call, crash mid-flush)
+        self._append_uncertain = False
+
+    def _client(self):
+        sheets = self.get_sheets()
+        if not sheets:
+            raise RuntimeError("Google Sheets is not connected")
+        return sheets
+
+    def load(self):
+        """Replay writes left over from the previous run"""
+        self._append_uncertain = bool(self.users_queue.load())
+        self.payments_queue.load()
+
+    def jobs(self):
+        return [self.users_queue.run(), self.payments_queue.run()]
+
+    async def close(self):
+        await self.users_queue.close()
+        await self.payments_queue.close()
+
+    async def read_users(self, priority=USER):
+        sheets = self._client()
+        return await sheets_gateway.run(
+            sheets.get_values, Config.USERS_SHEET_NAME, USERS_RANGE, priority=priority, hedge=True,
+            key=f"values:{Config.USERS_SHEET_NAME}!{USERS_RANGE}"
+        )
+
+    def user_changed(self, record):
+        self.users_changed([record])
+
+    def users_changed(self, records):
+        self.users_queue.put_many((record.user_id, {
+            'user_id': record.user_id,
+            'username': record.username,
+            'name': record.name,
+            'joined': int(time.time()),
+            'level': record.level
+        }) for record in records)
+
+    def payment_changed(self, payment):
+        self.payments_changed([payment])
+
+    def payments_changed(self, payments):
+        # One row per status change, so the key never coalesces two events
+        self.payments_queue.put_many(
+            (f"{payment['payment_id']}:{payment['status']}", self._payment_row(payment)) for payment in payments
+        )
+
+    @staticmethod
+    def _payment_row(payment):
+        return [
+            payment['payment_id'],
+            str(payment['user_id']),
+            payment['username'],
+            payment['name'],
+            payment['plan'],
+            payment['method'],
+            payment['status'],
+            payment['level'] or "",
+            str(payment['handled_by'] or ""),
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(payment['handled_at'] or payment['created']))
+        ]
+
+    async def _flush_users(self, entries):
+        sheets = self._client()
+        if not await self.storage.ensure_loaded(live=True):
+            # Without live sheet rows we cannot tell an update from a new row
+            raise RuntimeError("Users sheet rows are not loaded")
+
+        # Rows are resolved at flush time so users appended by an earlier
+        # batch are updated in place instead of appended twice
+        updates = []
+        appends = []
+        for entry in entries:
+            row = self.storage.sheet_row(entry['user_id'])
+            if row:
+                updates.append((row, entry['level']))
+            else:
+                appends.append(entry)
+
+        # Separate calls, so a timed-out update never leaves an append
+        # in flight that the retry does not know about
+        if updates:
+            await sheets_gateway.run(sheets.batch_update, Config.USERS_SHEET_NAME, [
+                {'range': f"E{row}", 'values': [[level]]}  # Level column
+                for row, level in updates
+            ])
+        if appends:
+            new_rows = [
+                [str(e['user_id']), e['username'], e['name'], str(e['joined']), e['level']]
+                for e in appends
+            ]
+            try:
+                rows = await sheets_gateway.run(_append_users, sheets, new_rows, self._append_uncertain)
+            except Exception:
+                self._append_uncertain = True
+                raise
+            self._append_uncertain = False
+            for user_id, row in rows.items():
+                self.storage.set_sheet_row(user_id, row)
+
+    async def _flush_payments(self, entries):
+        sheets = self._client()
+        await sheets_gateway.run(_append_payment_records, sheets, entries)
+
+
+def _append_payment_records(sheets, rows):
+    # Spreadsheets set up before payment records existed lack the sheet
+    sheets.ensure_worksheet(Config.PAYMENT_RECORDS_SHEET_NAME, PAYMENT_RECORD_HEADER)
+    return sheets.append_rows(Config.PAYMENT_RECORDS_SHEET_NAME, rows, priority=BACKGROUND)
+
+
+# One append to the Users sheet at a time: a retry waits for an earlier
+# attempt whose caller timed out to finish before looking for its rows
+_users_append_lock = threading.Lock()
+
+
+def _append_users(sheets, new_rows, check_existing):
+    """Append new users to the Users sheet; returns {user_id: sheet row}.
+
+    With ``check_existing`` the sheet is read first, and users an earlier
+    attempt already appended are located instead of appended again.
+    """
+    with _users_append_lock:
+        rows = {}
+        if check_existing:
+            index = UserIndex()
+            index.load(sheets.get_values(Config.USERS_SHEET_NAME, USERS_RANGE, priority=BACKGROUND))
+            for row in new_rows:
+                record = index.get(row[0])
+                if record:
+                    rows[record.user_id] = record.row
+            new_rows = [row for row in new_rows if int(row[0]) not in rows]
+        if new_rows:
+            response = sheets.append_rows(Config.USERS_SHEET_NAME, new_rows)
+            first_row = row_from_updated_range(response.get('updates', {}).get('updatedRange'))
+            if first_row:
+                rows.update((int(row[0]), first_row + offset) for offset, row in enumerate(new_rows))
+        return rows
+
+
+def _open_db(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Autocommit; every statement is a single small transaction
+    db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class PaymentLedger:
+    """Payments and their approval state in a local SQLite table"""
+
+    def __init__(self, db):
+        self.db = db
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS payments (
+                payment_id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                username TEXT,
+                name TEXT,
+                plan TEXT,
+                method TEXT,
+                status TEXT,
+                level TEXT,
+                created REAL,
+                handled_by INTEGER,
+                handled_at REAL,
+                file_unique_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS payments_user_status ON payments (user_id, status);
+            CREATE INDEX IF NOT EXISTS payments_status ON payments (status);
+        """)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(payments)")}
+        if "file_unique_id" not in columns:
+            self.db.execute("ALTER TABLE payments ADD COLUMN file_unique_id TEXT")
+
+    def add(self, payment):
+        payment = dict({field: None for field in PAYMENT_FIELDS}, **payment)
+        self.db.execute(
+            f"INSERT OR REPLACE INTO payments ({', '.join(PAYMENT_FIELDS)}) "
+            f"VALUES ({', '.join('?' * len(PAYMENT_FIELDS))})",
+            [payment[field] for field in PAYMENT_FIELDS]
+        )
+        return payment
+
+    def get(self, payment_id):
+        row = self.db.execute("SELECT * FROM payments WHERE payment_id = ?", (payment_id,)).fetchone()
+        return dict(row) if row else None
+
+    def latest_pending(self, user_id):
+        row = self.db.execute(
+            "SELECT * FROM payments WHERE user_id = ? AND status = ? ORDER BY created DESC LIMIT 1",
+            (int(user_id), PENDING)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def resolve(self, changes, status, handled_by):
+        """Move pending payments to ``status``; ``changes`` are (payment_id, level) pairs"""
+        handled_at = time.time()
+        resolved_ids = []
+        with self.db:
+            self.db.execute("BEGIN")
+            for payment_id, level in changes:
+                # Only the first to resolve a payment changes the row
+                cursor = self.db.execute(
+                    "UPDATE payments SET status = ?, level = ?, handled_by = ?, handled_at = ? "
+                    "WHERE payment_id = ? AND status = ?",
+                    (status, level, handled_by, handled_at, payment_id, PENDING)
+                )
+                if cursor.rowcount == 1:
+                    resolved_ids.append(payment_id)
+        return [self.get(payment_id) for payment_id in resolved_ids]
+
+    def reopen(self, payment_ids):
+        """Put payments approved by a failed ``Storage.approve_payments`` back to pending"""
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "UPDATE payments SET status = ?, level = NULL, handled_by = NULL, handled_at = NULL "
+                "WHERE payment_id = ? AND status = ?",
+                [(PENDING, payment_id, APPROVED) for payment_id in payment_ids]
+            )
+
+    def pending(self):
+        cursor = self.db.execute("SELECT * FROM payments WHERE status = ? ORDER BY created", (PENDING,))
+        return [dict(row) for row in cursor]
+
+    def prune(self, before):
+        """Delete approved/rejected payments handled before ``before``; returns how many"""
+        return self.db.execute(
+            "DELETE FROM payments WHERE status != ? AND handled_at < ?", (PENDING, before)
+        ).rowcount
+
+
+class Storage(ABC):
+    """Persistent bot state: users, payments and pending approvals"""
+
+    name = None
+
+    def __init__(self, get_sheets):
+        self.mirror = SheetsMirror(self, get_sheets)
+
+    async def start(self):
+        """Load local state; called once from the bot's startup hook.
+
+        Never waits for Sheets, the live data is loaded by ``ensure_loaded``
+        once the spreadsheet is reachable.
+        """
+        self.mirror.load()
+
+    def jobs(self):
+        """Background coroutines to run for the life of the bot"""
+        return self.mirror.jobs()
+
+    async def close(self):
+        await self.mirror.close()
+
+    @abstractmethod
+    async def ensure_loaded(self, live=False):
+        """Make sure users are loaded; returns success.
+
+        With ``live`` the data (and its sheet rows) must come from the
+        spreadsheet itself rather than a snapshot from the previous run.
+        """
+
+    @abstractmethod
+    def get_user(self, user_id):
+        pass
+
+    @abstractmethod
+    def set_user_level(self, user_id, username, name, level):
+        pass
+
+    @abstractmethod
+    def set_user_levels(self, changes):
+        """Apply many (user_id, username, name, level) changes in one go"""
+
+    @abstractmethod
+    def iter_users(self, level=None, after=None):
+        """Users (optionally of one level) in user_id order, starting after ``after``"""
+
+    @abstractmethod
+    def sheet_row(self, user_id):
+        pass
+
+    @abstractmethod
+    def set_sheet_row(self, user_id, row):
+        pass
+
+    # Payments live in a local SQLite ledger in every backend
+
+    @property
+    @abstractmethod
+    def ledger(self):
+        """The backend's ``PaymentLedger``"""
+
+    def add_payment(self, payment):
+        payment = self.ledger.add(payment)
+        self.mirror.payment_changed(payment)
+        return payment
+
+    def get_payment(self, payment_id):
+        return self.ledger.get(payment_id)
+
+    def latest_pending_payment(self, user_id):
+        return self.ledger.latest_pending(user_id)
+
+    def resolve_payment(self, payment_id, status, handled_by, level=None):
+        """Move a pending payment to ``status``.
+
+        Returns the updated payment, or None if it is unknown or was already
+        approved/rejected, so each payment is handled exactly once.
+        """
+        resolved = self.resolve_payments([payment_id], status, handled_by, level)
+        return resolved[0] if resolved else None
+
+    def resolve_payments(self, payment_ids, status, handled_by, level=None):
+        """``resolve_payment`` for many payments in one go; returns those that were still pending"""
+        resolved = self.ledger.resolve([(payment_id, level) for payment_id in payment_ids], status, handled_by)
+        self.mirror.payments_changed(resolved)
+        return resolved
+
+    def approve_payments(self, approvals, handled_by):
+        """Approve pending payments and give their users the level; ``approvals`` are (payment_id, level) pairs.
+
+        Returns the payments that were still pending. If the levels cannot
+        be written the payments go back to pending and the error is raised,
+        so the approval can simply be tried again.
+        """
+        resolved = self.ledger.resolve(approvals, APPROVED, handled_by)
+        if not resolved:
+            return resolved
+        try:
+            self.set_user_levels([(p['user_id'], p['username'], p['name'], p['level']) for p in resolved])
+        except Exception:
+            self.ledger.reopen([p['payment_id'] for p in resolved])
+            raise
+        self.mirror.payments_changed(resolved)
+        return resolved
+
+    def pending_payments(self):
+        return self.ledger.pending()
+
+
+class SheetsStorage(Storage):
+    """Sheets-only mode: Users sheet in memory, payments in a local SQLite ledger.
+
+    The ledger keeps pending payments (and the admin buttons pointing at
+    them) across restarts; approved and rejected ones are already logged
+    to the payment records sheet, so they are deleted after ``retention``
+    seconds.
+    """
+
+    name = "sheets"
+
+    def __init__(self, get_sheets, path=None, retention=None):
+        super().__init__(get_sheets)
+        self.index = UserIndex()
+        self.live = False
+        self.path = path or Config.PAYMENTS_PATH
+        self.retention = retention or Config.PAYMENT_RETENTION
+        self._ledger = None
+
+    @property
+    def ledger(self):
+        # Opened on first use, so importing the bot creates no files
+        if self._ledger is None:
+            self._ledger = PaymentLedger(_open_db(self.path))
+        return self._ledger
+
+    async def start(self):
+        await super().start()
+        rows = await asyncio.get_running_loop().run_in_executor(None, load_snapshot, Config.USERS_SHEET_NAME)
+        if rows is not None and not self.index.loaded:
+            self._load_index(rows)
+            logger.info(f"Warm-loaded {len(self.index)} users from snapshot")
+        self.prune_payments()
+
+    def jobs(self):
+        return super().jobs() + [self._prune_periodically()]
+
+    async def close(self):
+        await super().close()
+        if self._ledger is not None:
+            self._ledger.db.close()
+            self._ledger = None
+
+    def prune_payments(self):
+        try:
+            pruned = self.ledger.prune(time.time() - self.retention)
+        except sqlite3.Error as e:
+            logger.error(f"Error pruning handled payments: {e}")
+            return
+        if pruned:
+            logger.info(f"Pruned {pruned} handled payments")
+
+    async def _prune_periodically(self):
+        while True:
+            await asyncio.sleep(3600)
+            self.prune_payments()
+
+    def _load_index(self, rows):
+        index = UserIndex()
+        index.load(rows)
+        # Writes still waiting in the queue are newer than the sheet
+        for entry in self.mirror.users_queue.pending():
+            index.upsert(entry['user_id'], entry['username'], entry['name'], entry['level'])
+        self.index = index
+
+    async def ensure_loaded(self, live=False):
+        if self.live or (self.index.loaded and not live):
+            return True
+        try:
+            rows = await self.mirror.read_users()
+        except Exception as e:
+            logger.error(f"Error loading users: {e}")
+            return self.index.loaded and not live
+        if not self.live:
+            # Level changes made since a warm load are all still queued
+            # (flushing waits for live rows), so nothing is lost here
+            self._load_index(rows)
+            self.live = True
+            logger.info(f"Loaded {len(self.index)} users into the index")
+            await asyncio.get_running_loop().run_in_executor(None, save_snapshot, Config.USERS_SHEET_NAME, rows)
+        return True
+
+    def get_user(self, user_id):
+        return self.index.get(user_id)
+
+    def set_user_level(self, user_id, username, name, level):
+        return self.set_user_levels([(user_id, username, name, level)])[0]
+
+    def set_user_levels(self, changes):
+        records = [self.index.upsert(*change) for change in changes]
+        self.mirror.users_changed(records)
+        return records
+
+    def iter_users(self, level=None, after=None):
+        for record in self.index.iter_from(after):
+            if level is None or record.level == level:
+                yield record
+
+    def sheet_row(self, user_id):
+        record = self.index.get(user_id)
+        return record.row if record else None
+
+    def set_sheet_row(self, user_id, row):
+        record = self.index.get(user_id)
+        if record:
+            record.row = row
+
+
+class SQLiteStorage(Storage):
+    """Local SQLite (WAL) primary store, mirrored to the spreadsheet"""
+
+    name = "sqlite"
+
+    def __init__(self, get_sheets, path=None, shared=None):
+        super().__init__(get_sheets)
+        self.path = path or Config.SQLITE_PATH
+        # With several workers on one database only the leader imports
+        self.shared = shared
+        self.db = _open_db(self.path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                name TEXT,
+                level TEXT,
+                joined INTEGER,
+                sheet_row INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS users_level ON users (level);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._ledger = PaymentLedger(self.db)
+
+    @property
+    def ledger(self):
+        return self._ledger
+
+    async def ensure_loaded(self, live=False):
+        # SQLite is the primary copy, so there is no snapshot to warm from.
+        # Existing spreadsheet users are imported once, so their levels
+        # are known and their rows are updated instead of appended again
+        if self._meta("users_imported"):
+            return True
+        if self.shared is not None and not self.shared.is_leader:
+            return False
+        try:
+            rows = await self.mirror.read_users()
+        except Exception as e:
+            logger.error(f"Error importing users from Sheets: {e}")
+            return False
+        if self._meta("users_imported"):
+            # Another caller shared the same read and already imported it
+            return True
+        index = UserIndex()
+        index.load(rows)
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany("""
+                INSERT INTO users (user_id, username, name, level, sheet_row)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET sheet_row = excluded.sheet_row
+            """, [(r.user_id, r.username, r.name, r.level, r.row) for r in index])
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('users_imported', '1')")
+        logger.info(f"Imported {len(index)} users from Sheets into SQLite")
+        return True
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    @staticmethod
+    def _record(row):
+        return UserRecord(row["user_id"], row["username"], row["name"], row["level"], row["sheet_row"])
+
+    def get_user(self, user_id):
+        row = self.db.execute("SELECT * FROM users WHERE user_id = ?", (int(user_id),)).fetchone()
+        return self._record(row) if row else None
+
+    def set_user_level(self, user_id, username, name, level):
+        return self.set_user_levels([(user_id, username, name, level)])[0]
+
+    def set_user_levels(self, changes):
+        joined = int(time.time())
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany("""
+                INSERT INTO users (user_id, username, name, level, joined)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET level = excluded.level
+            """, [(int(user_id), username, name, level, joined) for user_id, username, name, level in changes])
+        records = [self.get_user(change[0]) for change in changes]
+        self.mirror.users_changed(records)
+        return records
+
+    def iter_users(self, level=None, after=None):
+        query = "SELECT * FROM users WHERE user_id > ?"
+        params = [after if after is not None else -1]
+        if level is not None:
+            query += " AND level = ?"
+            params.append(level)
+        for row in self.db.execute(query + " ORDER BY user_id", params):
+            yield self._record(row)
+
+    def sheet_row(self, user_id):
+        row = self.db.execute("SELECT sheet_row FROM users WHERE user_id = ?", (int(user_id),)).fetchone()
+        return row["sheet_row"] if row else None
+
+    def set_sheet_row(self, user_id, row):
+        self.db.execute("UPDATE users SET sheet_row = ? WHERE user_id = ?", (row, int(user_id)))
+
+
+def create_storage(get_sheets, shared=None):
+    """Build the storage backend selected by ``Config.STORAGE_BACKEND``.
+
+    With ``shared`` (several worker processes) the SQLite backend is always
+    used, since Sheets-only mode keeps users in each process's memory.
+    """
+    if Config.STORAGE_BACKEND == "sqlite" or shared is not None:
+        if Config.STORAGE_BACKEND != "sqlite":
+            logger.info("Using the sqlite storage backend shared by all workers")
+        return SQLiteStorage(get_sheets, shared=shared)
+    if Config.STORAGE_BACKEND != "sheets":
+        logger.warning(f"Unknown STORAGE_BACKEND {Config.STORAGE_BACKEND!r}, using sheets")
+    return SheetsStorage(get_sheets)
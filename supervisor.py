@@ -0,0 +1,58 @@
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def run_workers(count):
+    """Run ``count`` copies of this program as webhook workers until stopped.
+
+    Each worker gets its own WORKER_ID and binds the webhook port with
+    SO_REUSEPORT, so the kernel spreads connections between them. Workers
+    that exit are restarted; SIGINT/SIGTERM are passed on to all of them.
+    """
+    env = dict(os.environ)
+    # Every worker must check the same secret, and Telegram is told it once
+    env["WEBHOOK_SECRET"] = Config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    workers = {}
+    stopping = False
+
+    def spawn(worker_id):
+        workers[worker_id] = subprocess.Popen(
+            [sys.executable] + sys.argv, env=dict(env, WORKER_ID=str(worker_id))
+        )
+        logger.info(f"Started worker {worker_id} (pid {workers[worker_id].pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for worker in workers.values():
+            if worker.poll() is None:
+                worker.send_signal(signum)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for worker_id in range(count):
+        spawn(worker_id)
+
+    while not stopping:
+        time.sleep(1)
+        for worker_id, worker in list(workers.items()):
+            if worker.poll() is not None and not stopping:
+                logger.warning(f"Worker {worker_id} exited with {worker.returncode}, restarting")
+                spawn(worker_id)
+
+    for worker_id, worker in workers.items():
+        try:
+            worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Worker {worker_id} did not stop in time, killing it")
+            worker.kill()
@@ -0,0 +1,101 @@
+import asyncio
+import sys
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class _KeyLock:
+    __slots__ = ("lock", "holders")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently across users, in order within one user.
+
+    Updates from the same user (or chat, for updates without a user) wait
+    on a per-user lock, so the payment flow's ``user_data`` keys are never
+    touched by two handlers at once. Up to ``max_concurrent_updates``
+    handlers run at the same time overall.
+
+    PTB's own semaphore (taken by ``process_update`` before calling
+    ``do_process_update``) is given a limit that is never reached; the
+    real one is taken here, after the per-user lock, so one user's
+    backlog can never hold every slot while it waits on itself.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(sys.maxsize)
+        self.concurrency = max_concurrent_updates
+        # Created on first use so it binds to the running event loop
+        self._slots = None
+        self._locks = {}
+        self.waiting = 0
+        self.active = 0
+        self.processed = 0
+
+    @staticmethod
+    def update_key(update):
+        user = getattr(update, "effective_user", None)
+        if user:
+            return ("user", user.id)
+        chat = getattr(update, "effective_chat", None)
+        if chat:
+            return ("chat", chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        # asyncio.Lock is FIFO, and tasks reach it in the order the
+        # Application created them, so per-user order holds
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        key = self.update_key(update)
+        if key is None:
+            async with self._slots:
+                await self._process(coroutine)
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyLock()
+        entry.holders += 1
+        self.waiting += 1
+        started = False
+        try:
+            async with entry.lock:
+                async with self._slots:
+                    self.waiting -= 1
+                    started = True
+                    self.active += 1
+                    try:
+                        await self._process(coroutine)
+                    finally:
+                        self.active -= 1
+        finally:
+            if not started:
+                self.waiting -= 1
+            entry.holders -= 1
+            if not entry.holders:
+                del self._locks[key]
+
+    async def _process(self, coroutine):
+        await coroutine
+        self.processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        """Queue-depth metrics: updates waiting, running, and users with work queued"""
+        return {
+            'waiting': self.waiting,
+            'active': self.active,
+            'users': len(self._locks),
+            'processed': self.processed,
+            'max_concurrent': self.concurrency
+        }
@@ -0,0 +1,91 @@
+import bisect
+import re
+
+# Users sheet columns: user_id | username | name | joined | level
+USERS_RANGE = "A:E"
+
+
+class UserRecord:
+    """Compact in-memory copy of one Users sheet row"""
+
+    __slots__ = ("user_id", "username", "name", "level", "row")
+
+    def __init__(self, user_id, username, name, level, row=None):
+        self.user_id = user_id
+        self.username = username
+        self.name = name
+        self.level = level
+        self.row = row  # 1-based sheet row, None until written
+
+    def to_dict(self):
+        return {
+            'level': self.level,
+            'user_id': self.user_id,
+            'name': self.name,
+            'username': self.username
+        }
+
+
+class UserIndex:
+    """user_id -> UserRecord map loaded from one bulk read of the Users sheet"""
+
+    def __init__(self):
+        self._records = {}
+        # user_ids in ascending order, for paging through users
+        self._ids = []
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(list(self._records.values()))
+
+    def load(self, rows):
+        """Rebuild the index from the raw values of ``USERS_RANGE``"""
+        records = {}
+        for row_number, row in enumerate(rows, start=1):
+            # Only the first column is matched, and header/blank rows are skipped
+            if not row or not row[0].strip().isdigit():
+                continue
+            user_id = int(row[0])
+            records[user_id] = UserRecord(
+                user_id=user_id,
+                username=row[1] if len(row) > 1 else 'Not set',
+                name=row[2] if len(row) > 2 else 'User',
+                level=row[4] if len(row) > 4 and row[4] else 'None',
+                row=row_number
+            )
+        self._records = records
+        self._ids = sorted(records)
+        self.loaded = True
+
+    def get(self, user_id):
+        return self._records.get(int(user_id))
+
+    def iter_from(self, after=None):
+        """Records in user_id order, starting after ``after``; consume before changing the index"""
+        position = 0 if after is None else bisect.bisect_right(self._ids, after)
+        while position < len(self._ids):
+            yield self._records[self._ids[position]]
+            position += 1
+
+    def upsert(self, user_id, username, name, level, row=None):
+        """Record a level change; new users keep the profile they were added with"""
+        user_id = int(user_id)
+        record = self._records.get(user_id)
+        if record is None:
+            record = UserRecord(user_id, username, name, level, row)
+            self._records[user_id] = record
+            bisect.insort(self._ids, user_id)
+        else:
+            record.level = level
+            if row is not None:
+                record.row = row
+        return record
+
+
+def row_from_updated_range(updated_range):
+    """Extract the row number from an A1 range such as ``Users!A12:E12``"""
+    match = re.search(r"![A-Z]+(\d+)", updated_range or "")
+    return int(match.group(1)) if match else None
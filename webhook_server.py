@@ -0,0 +1,147 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from http import HTTPStatus
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Update
+
+from config import Config
+from metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueue(asyncio.Queue):
+    """Update queue whose limit covers updates still being processed.
+
+    ``Application`` hands updates off to tasks as soon as it reads them, so a
+    plain ``maxsize`` would never fill up. Here an update counts against the
+    limit from ``put`` until its ``task_done``.
+    """
+
+    def __init__(self, limit=None):
+        super().__init__()
+        self.limit = limit or Config.UPDATE_QUEUE_SIZE
+        self.pending = 0
+        self._room = None  # asyncio.Event, created on the running loop
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        self.pending += 1
+
+    def task_done(self):
+        super().task_done()
+        self.pending -= 1
+        if self._room is not None and self.pending < self.limit:
+            self._room.set()
+
+    async def put_update(self, update, timeout):
+        """Queue an update, waiting up to ``timeout`` for room under the limit"""
+        if self._room is None:
+            self._room = asyncio.Event()
+
+        async def wait_for_room():
+            while self.pending >= self.limit:
+                self._room.clear()
+                await self._room.wait()
+            self.put_nowait(update)
+
+        await asyncio.wait_for(wait_for_room(), timeout)
+
+
+class IndexHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("Meow Advertising Service Bot is running!")
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Prometheus scrape endpoint"""
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render_metrics())
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Receive updates from Telegram and queue them for the Application"""
+
+    def initialize(self, bot_application, secret_token):
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self):
+        token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, self.secret_token):
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST)
+
+        try:
+            await self.bot_application.update_queue.put_update(update, Config.UPDATE_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Telegram redelivers on non-2xx, so this pushes back instead of dropping
+            logger.warning("Update queue is full, asking Telegram to retry")
+            raise tornado.web.HTTPError(HTTPStatus.SERVICE_UNAVAILABLE)
+
+        self.set_status(HTTPStatus.OK)
+
+    def log_exception(self, typ, value, tb):
+        # Expected HTTP errors are already logged above
+        if not isinstance(value, tornado.web.HTTPError):
+            super().log_exception(typ, value, tb)
+
+
+def make_web_app(application, secret_token):
+    return tornado.web.Application([
+        (r"/", IndexHandler),
+        (r"/metrics", MetricsHandler),
+        (r"/webhook", WebhookHandler, {"bot_application": application, "secret_token": secret_token}),
+    ])
+
+
+async def serve_webhook(application, secret_token):
+    """Run the Application and the webhook server on the current event loop until stopped"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig_name in ("SIGINT", "SIGTERM"):
+        try:
+            loop.add_signal_handler(getattr(signal, sig_name), stop_event.set)
+        except (NotImplementedError, AttributeError):
+            pass
+
+    server = HTTPServer(make_web_app(application, secret_token), xheaders=True)
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+
+        # Several workers may listen on the same port (see supervisor.py)
+        server.listen(Config.PORT, address="0.0.0.0", reuse_port=Config.WEB_WORKERS > 1)
+        if Config.WORKER_ID in ("", "0"):
+            # Registered once, by the first worker
+            await application.bot.set_webhook(
+                url=f"{Config.WEBHOOK_URL}/webhook",
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS
+            )
+        await application.start()
+        logger.info(f"Webhook server listening on port {Config.PORT}")
+        await stop_event.wait()
+    finally:
+        server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
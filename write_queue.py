@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+import random
+
+from config import Config
+from sheets_gateway import OPEN, sheets_gateway
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Durable write-behind queue that coalesces pending writes per key.
+
+    Every ``put()`` is appended to a JSON-lines journal before it is
+    acknowledged, so queued writes survive a crash and are replayed by
+    ``load()`` on the next start. A background loop hands all pending
+    entries to ``flush_fn`` in one batch every ``interval`` seconds and
+    backs off with jitter while the batch keeps failing.
+    """
+
+    def __init__(self, name, journal_path, flush_fn, interval=None, max_backoff=None):
+        self.name = name
+        self.journal_path = journal_path
+        self.flush_fn = flush_fn  # async callable taking a list of entries
+        self.interval = interval or Config.WRITE_FLUSH_INTERVAL
+        self.max_backoff = max_backoff or Config.WRITE_MAX_BACKOFF
+        self.failures = 0
+        self._pending = {}
+        # Created on first use so it binds to the running event loop
+        self._lock = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pending(self):
+        return list(self._pending.values())
+
+    def load(self):
+        """Replay entries left in the journal by a previous run"""
+        if not os.path.exists(self.journal_path):
+            return []
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    key, entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+                self._pending[key] = entry
+        if self._pending:
+            logger.info(f"Replayed {len(self._pending)} queued {self.name} writes")
+        return self.pending()
+
+    def put(self, key, entry):
+        """Queue a write; later writes for the same key replace earlier ones"""
+        self.put_many([(key, entry)])
+
+    def put_many(self, items):
+        """Queue several (key, entry) writes with a single journal sync"""
+        items = [(str(key), entry) for key, entry in items]
+        if not items:
+            return
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps([key, entry]) + "\n" for key, entry in items))
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending.update(items)
+
+    async def flush(self):
+        """Write all pending entries in one batch; returns False on failure"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return True
+            batch = dict(self._pending)
+            try:
+                await self.flush_fn(list(batch.values()))
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error flushing {len(batch)} {self.name} writes (attempt {self.failures}): {e}")
+                return False
+            self.failures = 0
+            # Entries replaced while the batch was in flight stay queued
+            for key, entry in batch.items():
+                if self._pending.get(key) is entry:
+                    del self._pending[key]
+            self._compact()
+            return True
+
+    def _compact(self):
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, entry in self._pending.items():
+                f.write(json.dumps([key, entry]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _next_delay(self):
+        if not self.failures:
+            return self.interval
+        backoff = min(self.interval * 2 ** self.failures, self.max_backoff)
+        return backoff * random.uniform(0.5, 1.5)
+
+    async def run(self):
+        """Flush on an interval until cancelled"""
+        while True:
+            await asyncio.sleep(self._next_delay())
+            await self.flush()
+
+    async def close(self, attempts=3):
+        """Final flush on shutdown; anything left stays in the journal.
+
+        Retries come ``interval`` apart, not after the run loop's backoff,
+        and stop while the Sheets circuit breaker is open: the host kills
+        a slow shutdown, and the journal keeps the entries anyway.
+        """
+        for attempt in range(attempts):
+            if await self.flush():
+                return
+            if attempt == attempts - 1 or sheets_gateway.breaker.state == OPEN:
+                break
+            await asyncio.sleep(self.interval)
+        logger.warning(f"{len(self._pending)} {self.name} writes left in {self.journal_path}")